@@ -0,0 +1,96 @@
+# Estrazione colonnare per SELector (pandas)
+# L'estrazione è un equi-join tra text triples e model triples su (phr, t1, t2):
+# i tipi vengono riassegnati con trasformazioni vettorizzate sulle colonne e il
+# join è un unico hash join (MultiIndex.get_indexer) su tutto il blocco
+import pandas as pd
+
+
+TEXT_COLUMNS = ['phr', 'e1', 't1', 'e2', 't2']
+
+
+# Indice hash sui pattern delle model triples: (MultiIndex su (phr, t1, t2), relazioni)
+def build_column_index(model_triples):
+
+    model_df = pd.DataFrame(list(model_triples), columns=['phr', 't1', 't2', 'rel', 'count'])
+    index = pd.MultiIndex.from_arrays([model_df['phr'], model_df['t1'], model_df['t2']])
+
+    return index, model_df['rel'].to_numpy(dtype=object)
+
+
+# Legge le text triples come blocchi di DataFrame (path tsv, DataFrame o lista di tuple)
+def read_frames(source, chunk_size=None):
+
+    if type(source) is str:
+        if chunk_size:
+            yield from pd.read_csv(source, sep='\t', names=TEXT_COLUMNS, dtype=str,
+                                   keep_default_na=False, chunksize=chunk_size)
+        else:
+            yield pd.read_csv(source, sep='\t', names=TEXT_COLUMNS, dtype=str, keep_default_na=False)
+    elif isinstance(source, pd.DataFrame):
+        yield source.iloc[:, :5].set_axis(TEXT_COLUMNS, axis=1)
+    else:
+        yield pd.DataFrame(list(source), columns=TEXT_COLUMNS)
+
+
+# Riassegnazione tipi vettorizzata, stessa semantica di SELector._predict:
+# t1 viene riassegnato se presente nel mapping, t2 solo se lo sono entrambi
+def remap_type_columns(t1, t2, type_remapping):
+
+    new_t1 = t1.map(type_remapping)
+    new_t2 = t2.map(type_remapping)
+    ok1 = new_t1.notna()
+    ok2 = ok1 & new_t2.notna()
+
+    return new_t1.where(ok1, t1), new_t2.where(ok2, t2)
+
+
+# Estrazione da un DataFrame di text triples, restituisce la colonna delle relazioni
+# (array di stringhe, 'unknown' se il pattern non è nel modello)
+# lsh_index (lsh.LSHIndex) assegna alle righe senza corrispondenza esatta il pattern più simile
+def match_frame(frame, column_index, type_remapping=None, no_types=False, lsh_index=None):
+
+    t1, t2 = frame['t1'], frame['t2']
+    if no_types:
+        t1 = t2 = pd.Series('', index=frame.index)
+    if type_remapping:
+        t1, t2 = remap_type_columns(t1, t2, type_remapping)
+
+    index, relations = column_index
+    if len(relations) == 0:
+        return pd.Series('unknown', index=frame.index)
+    positions = index.get_indexer(pd.MultiIndex.from_arrays([frame['phr'], t1, t2]))
+    rel = pd.Series(relations[positions], index=frame.index)
+    missing = positions < 0
+    rel[missing] = 'unknown'
+
+    # Fallback sui pattern simili, una sola interrogazione batch per le righe mancanti
+    if lsh_index is not None and missing.any():
+        patterns = list(zip(frame['phr'][missing].tolist(), t1[missing].tolist(), t2[missing].tolist()))
+        matches = lsh_index.query_many(patterns)
+        rel[missing] = [match[3] if match is not None else 'unknown' for match in matches]
+
+    return rel
+
+
+# Estrazione colonnare, restituisce i fatti [(e1, rel, e2), ...]
+# o, con as_frame, un DataFrame con colonne e1, rel, e2 (evita di creare le tuple)
+def harvest_frame(frame, column_index, type_remapping=None, no_types=False, keep_unknown=False, as_frame=False,
+                  lsh_index=None):
+
+    rel = match_frame(frame, column_index, type_remapping, no_types, lsh_index)
+    facts = pd.DataFrame({'e1': frame['e1'], 'rel': rel, 'e2': frame['e2']})
+    if not keep_unknown:
+        facts = facts[facts['rel'] != 'unknown']
+    if as_frame:
+        return facts
+
+    return list(zip(facts['e1'].tolist(), facts['rel'].tolist(), facts['e2'].tolist()))
+
+
+# Unisce i DataFrame dei fatti estratti dai singoli blocchi
+def concat_frames(frames):
+
+    if not frames:
+        return pd.DataFrame(columns=['e1', 'rel', 'e2'])
+
+    return pd.concat(frames, ignore_index=True)
@@ -2,7 +2,7 @@
 # Training set di dati reali (KG con 120.000 fatti e TT con 1.200.000 testi + entità e tipi)
 # Test set ricavato da FewRel (40.177 frasi estratte dal testo con entità e tipi)
 
-from type_controller import types_remap
+from type_controller import types_remap, get_lattice
 from selector_extended import SELector
 import pandas as pd
 import json
@@ -54,7 +54,9 @@ if answ[0].lower() == 'y':
     
     type_remapping_opt = input('Riassegnare i tipi a grana larga? (verrano usati comunque i tipi) y / n (default = No) > ')
     if type_remapping_opt is not '' and type_remapping_opt[0].lower() == 'y':
-        type_remapping = types_remap('data/dbpedia_stuff/types_hierarchy_fixed.tsv', -2)
+        # Reticolo dei tipi compilato una volta e salvato accanto alla gerarchia
+        type_lattice = get_lattice('data/dbpedia_stuff/types_hierarchy_fixed.tsv', 'data/dbpedia_stuff/types_hierarchy_fixed.lattice.pkl')
+        type_remapping = types_remap(type_lattice, -2)
 
     enable_LP_opt = input('Abilitare link prediction? y / n (default = No) > ')
     if enable_LP_opt is not '' and enable_LP_opt[0].lower() == 'y':
@@ -83,7 +85,7 @@ slc = SELector(rseed=42,
 
 # Addestramento
 print('\n* Avvio addestramento modello:')
-slc.train(lector_TT, lector_KG)
+slc.train(lector_TT, lector_KG, keep_tables=True)
 
 
 # Informazioni stato del modello
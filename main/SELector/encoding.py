@@ -0,0 +1,322 @@
+# Codifica a dizionario delle tabelle interne di SELector
+# Frasi, entità, tipi e relazioni vengono mappati una sola volta su id int32
+# e le tabelle sono memorizzate come colonne NumPy, le stringhe vengono
+# ricostruite solo in output (decode)
+import numpy as np
+
+
+# Campi delle tabelle di SELector
+TEXT_FIELDS = ('phr', 'e1', 't1', 'e2', 't2')
+TRIPLE_FIELDS = ('phr', 'e1', 't1', 'e2', 't2', 'rel')
+MODEL_FIELDS = ('phr', 't1', 't2', 'rel', 'count')
+
+
+# Dizionario bidirezionale stringa <-> id intero
+class Vocabulary:
+
+    def __init__(self, strings=()):
+        self.str2id = dict()
+        self.id2str = list()
+        for string in strings:
+            self.add(string)
+
+    def __len__(self):
+        return len(self.id2str)
+
+    # Restituisce l'id della stringa, aggiungendola se non presente
+    def add(self, string):
+        try:
+            return self.str2id[string]
+        except KeyError:
+            self.str2id[string] = len(self.id2str)
+            self.id2str.append(string)
+            return self.str2id[string]
+
+    # Codifica una sequenza di stringhe aggiungendo quelle nuove al vocabolario
+    def encode(self, strings):
+        add = self.add
+        return np.fromiter((add(s) for s in strings), dtype=np.int32, count=len(strings))
+
+    # Codifica senza modificare il vocabolario, le stringhe sconosciute diventano -1
+    def lookup(self, strings):
+        get = self.str2id.get
+        return np.fromiter((get(s, -1) for s in strings), dtype=np.int32, count=len(strings))
+
+    # Decodifica una sequenza di id
+    def decode(self, ids):
+        id2str = self.id2str
+        return [id2str[i] for i in ids]
+
+
+# I vocabolari condivisi dalle tabelle di un modello
+# (e1, e2 condividono le entità, t1, t2 condividono i tipi)
+class Vocabularies:
+
+    def __init__(self):
+        self.phrases = Vocabulary()
+        self.entities = Vocabulary()
+        self.types = Vocabulary([''])  # '' è il tipo usato con no_types
+        self.relations = Vocabulary(['unknown'])
+
+    # Vocabolario associato ad un campo, None per i campi numerici (e.g. count)
+    def for_field(self, field):
+        return {'phr': self.phrases,
+                'e1': self.entities, 'e2': self.entities,
+                't1': self.types, 't2': self.types,
+                'h': self.entities, 't': self.entities,
+                'rel': self.relations, 'r': self.relations}.get(field)
+
+
+# Tabella a colonne di id interi, si comporta come una lista di tuple
+# in lettura (len, slicing, iterazione) decodificando solo le righe richieste
+class EncodedTable:
+
+    def __init__(self, fields, vocabs, columns=None):
+        self.fields = tuple(fields)
+        self.vocabs = vocabs
+        if columns is None:
+            columns = {f: np.empty(0, dtype=np.int32) for f in self.fields}
+        self.columns = columns
+
+    def __len__(self):
+        return len(self.columns[self.fields[0]])
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return self.decode_rows(np.arange(len(self))[key])
+        return self.decode_rows([key])[0]
+
+    def __iter__(self):
+        block = 100000
+        for start in range(0, len(self), block):
+            yield from self.decode_rows(np.arange(start, min(start + block, len(self))))
+
+    def __getattr__(self, field):
+        try:
+            return self.__dict__['columns'][field]
+        except KeyError:
+            raise AttributeError(field)
+
+    # Decodifica le righe con gli indici passati in una lista di tuple
+    def decode_rows(self, idx):
+        decoded = list()
+        for f in self.fields:
+            values = self.columns[f][idx]
+            vocab = self.vocabs.for_field(f)
+            decoded.append(vocab.decode(values) if vocab is not None else values.tolist())
+        return list(zip(*decoded))
+
+    # Nuova tabella con le sole righe indicate (maschera o indici)
+    def take(self, idx):
+        return EncodedTable(self.fields, self.vocabs, {f: c[idx] for f, c in self.columns.items()})
+
+    # Costruisce una tabella codificando blocchi di tuple [[(...), ...], ...]
+    @classmethod
+    def from_chunks(cls, fields, vocabs, chunks):
+        parts = {f: list() for f in fields}
+        for chunk in chunks:
+            if not chunk:
+                continue
+            for f, values in zip(fields, zip(*chunk)):
+                vocab = vocabs.for_field(f)
+                parts[f].append(vocab.encode(values) if vocab is not None else np.asarray(values, dtype=np.int64))
+        columns = {f: np.concatenate(p) if p else np.empty(0, dtype=np.int32) for f, p in parts.items()}
+        return cls(fields, vocabs, columns)
+
+
+# Tabella di riassegnazione tipi su id: (nuovo id per tipo, maschera tipi presenti nel mapping)
+def encode_type_remapping(type_remapping, types):
+
+    # Tutti i tipi del mapping entrano nel vocabolario prima di costruire gli array
+    # così anche i tipi mai visti in addestramento vengono riassegnati in estrazione
+    pairs = [(types.add(typ), types.add(new_typ)) for typ, new_typ in type_remapping.items()]
+    remap = np.arange(len(types), dtype=np.int32)
+    has_remap = np.zeros(len(types), dtype=bool)
+    for typ_id, new_id in pairs:
+        remap[typ_id] = new_id
+        has_remap[typ_id] = True
+
+    return remap, has_remap
+
+
+# Riassegnazione tipi vettorizzata, stessa semantica di SELector._predict:
+# t1 viene riassegnato se presente nel mapping, t2 solo se lo sono entrambi
+def remap_types(t1, t2, remap, has_remap):
+
+    known1 = t1 >= 0
+    known2 = t2 >= 0
+    ok1 = known1.copy()
+    ok1[known1] = has_remap[t1[known1]]
+    ok2 = known2.copy()
+    ok2[known2] = has_remap[t2[known2]]
+    new_t1 = np.where(ok1, remap[np.where(ok1, t1, 0)], t1)
+    new_t2 = np.where(ok1 & ok2, remap[np.where(ok1 & ok2, t2, 0)], t2)
+
+    return new_t1.astype(np.int32), new_t2.astype(np.int32)
+
+
+# Chiave int64 di una coppia di entità
+def pair_keys(e1, e2, n_entities):
+
+    return e1.astype(np.int64) * n_entities + e2
+
+
+# Chiave int64 di un pattern (phr, t1, t2), -1 se uno dei campi è sconosciuto
+def pattern_keys(phr, t1, t2, n_types):
+
+    keys = (phr.astype(np.int64) * n_types + t1) * n_types + t2
+    keys[(phr < 0) | (t1 < 0) | (t2 < 0)] = -1
+
+    return keys
+
+
+# Distant supervision come equi-join tra coppie (e1, e2) delle text triples e (h, t) del kg
+# Restituisce (indici delle righe labeled, relazioni associate, indici delle righe unlabeled)
+# nello stesso ordine della versione a stringhe, con unique_relations le relazioni ripetute
+# per la stessa coppia vengono contate una sola volta (come con i set)
+def distant_supervision(text_e1, text_e2, kg_h, kg_r, kg_t, n_entities, unique_relations=True):
+
+    kg_keys = pair_keys(kg_h, kg_t, n_entities)
+    if unique_relations:
+        _, first = np.unique(np.stack([kg_keys, kg_r.astype(np.int64)]), axis=1, return_index=True)
+        first.sort()
+        kg_keys, kg_r = kg_keys[first], kg_r[first]
+    order = np.argsort(kg_keys, kind='stable')
+    sorted_keys, sorted_r = kg_keys[order], kg_r[order]
+
+    # Per ogni text triple l'intervallo dei fatti con la stessa coppia
+    keys = pair_keys(text_e1, text_e2, n_entities)
+    left = np.searchsorted(sorted_keys, keys, side='left')
+    n_match = np.searchsorted(sorted_keys, keys, side='right') - left
+
+    # Espansione: una riga labeled per ogni relazione della coppia
+    labeled_idx = np.repeat(np.arange(len(keys)), n_match)
+    starts = np.repeat(left, n_match)
+    offsets = np.arange(len(labeled_idx)) - np.repeat(np.cumsum(n_match) - n_match, n_match)
+    labeled_rel = sorted_r[starts + offsets].astype(np.int32)
+    unlabeled_idx = np.flatnonzero(n_match == 0)
+
+    return labeled_idx, labeled_rel, unlabeled_idx
+
+
+# Conteggio pattern e scelta della relazione con "max count" su colonne intere
+# Riproduce l'ordine della versione a dizionari: a parità di conteggio vince la
+# relazione vista per prima, i pattern a parità di conteggio restano in ordine
+# di prima occorrenza. Restituisce le colonne di model triples
+def build_model_columns(phr, t1, t2, rel, unknown_id):
+
+    if len(phr) == 0:
+        empty = {f: np.empty(0, dtype=np.int32) for f in MODEL_FIELDS}
+        empty['count'] = np.empty(0, dtype=np.int64)
+        return empty
+
+    rows = np.stack([phr, t1, t2, rel]).astype(np.int64)
+    groups, first, counts = np.unique(rows, axis=1, return_index=True, return_counts=True)
+
+    # Per ogni pattern: conteggio decrescente, poi prima occorrenza crescente
+    order = np.lexsort((first, -counts, groups[2], groups[1], groups[0]))
+    groups, first, counts = groups[:, order], first[order], counts[order]
+    new_pattern = np.ones(len(order), dtype=bool)
+    new_pattern[1:] = np.any(groups[:3, 1:] != groups[:3, :-1], axis=0)
+    starts = np.flatnonzero(new_pattern)
+    pattern_first = np.minimum.reduceat(first, starts)
+
+    best = groups[:, starts]
+    best_counts = counts[starts]
+    keep = best[3] != unknown_id
+    best, best_counts, pattern_first = best[:, keep], best_counts[keep], pattern_first[keep]
+
+    # Ordina pattern per occorrenza decrescente (stabile rispetto all'inserimento)
+    order = np.lexsort((pattern_first, -best_counts))
+    return {'phr': best[0][order].astype(np.int32),
+            't1': best[1][order].astype(np.int32),
+            't2': best[2][order].astype(np.int32),
+            'rel': best[3][order].astype(np.int32),
+            'count': best_counts[order]}
+
+
+# Indice ordinato sulle chiavi (phr, t1, t2) delle model triples
+# per il match esatto vettorizzato delle text triples
+class PatternIndex:
+
+    def __init__(self, model_table):
+        self.n_types = len(model_table.vocabs.types)
+        columns = model_table.columns
+        keys = pattern_keys(columns['phr'], columns['t1'], columns['t2'], self.n_types)
+        self.order = np.argsort(keys)
+        self.sorted_keys = keys[self.order]
+        self.rel = columns['rel']
+
+    # Per ogni riga l'id della relazione o -1 se il pattern non è nel modello
+    def match(self, phr, t1, t2):
+        keys = pattern_keys(phr, t1, t2, self.n_types)
+        rel = np.full(len(keys), -1, dtype=np.int32)
+        if len(self.sorted_keys) == 0:
+            return rel
+        pos = np.searchsorted(self.sorted_keys, keys)
+        pos[pos == len(self.sorted_keys)] = 0
+        found = (keys >= 0) & (self.sorted_keys[pos] == keys)
+        rel[found] = self.rel[self.order[pos[found]]]
+        return rel
+
+
+# Distant supervision su tabelle codificate, restituisce le tabelle (labeled, unlabeled)
+# type_remap_ids è il risultato di encode_type_remapping (o None)
+def supervise_tables(text_table, kg_table, type_remap_ids=None, no_types=False, unique_relations=True):
+
+    vocabs = text_table.vocabs
+    t1, t2 = text_table.t1, text_table.t2
+    if type_remap_ids:
+        t1, t2 = remap_types(t1, t2, *type_remap_ids)
+    if no_types:
+        t1 = t2 = np.zeros(len(text_table), dtype=np.int32)  # id del tipo ''
+
+    labeled_idx, labeled_rel, unlabeled_idx = distant_supervision(
+        text_table.e1, text_table.e2, kg_table.h, kg_table.r, kg_table.t,
+        len(vocabs.entities), unique_relations)
+
+    tables = list()
+    for idx, rel in [(labeled_idx, labeled_rel), (unlabeled_idx, None)]:
+        columns = {'phr': text_table.phr[idx], 'e1': text_table.e1[idx], 't1': t1[idx],
+                   'e2': text_table.e2[idx], 't2': t2[idx]}
+        if rel is None:
+            rel = np.full(len(idx), vocabs.relations.str2id['unknown'], dtype=np.int32)
+        columns['rel'] = rel
+        tables.append(EncodedTable(TRIPLE_FIELDS, vocabs, columns))
+
+    return tables[0], tables[1]
+
+
+# Costruisce la tabella delle model triples a partire da labeled e unlabeled codificate
+def build_model_table(labeled, unlabeled):
+
+    vocabs = labeled.vocabs
+    phr, t1, t2, rel = [np.concatenate([labeled.columns[f], unlabeled.columns[f]]) for f in ('phr', 't1', 't2', 'rel')]
+    columns = build_model_columns(phr, t1, t2, rel, vocabs.relations.str2id['unknown'])
+
+    return EncodedTable(MODEL_FIELDS, vocabs, columns)
+
+
+# Estrazione vettorizzata da un blocco di text triples [(phr, e1, t1, e2, t2), ...]
+# Solo frasi e tipi vengono codificati (senza modificare i vocabolari), le entità
+# passano direttamente in output. Restituisce la lista di fatti [(e1, rel, e2), ...]
+def harvest_rows(rows, index, vocabs, type_remap_ids=None, no_types=False, keep_unknown=False):
+
+    if not rows:
+        return list()
+    phrs, e1s, t1s, e2s, t2s = zip(*rows)
+    phr = vocabs.phrases.lookup(phrs)
+    if no_types:
+        t1 = t2 = np.zeros(len(rows), dtype=np.int32)
+    else:
+        t1, t2 = vocabs.types.lookup(t1s), vocabs.types.lookup(t2s)
+    if type_remap_ids:
+        t1, t2 = remap_types(t1, t2, *type_remap_ids)
+
+    rel = index.match(phr, t1, t2)
+    relations = vocabs.relations.id2str
+    if keep_unknown:
+        return [(e1s[i], relations[r] if r >= 0 else 'unknown', e2s[i]) for i, r in enumerate(rel.tolist())]
+    unknown_id = vocabs.relations.str2id['unknown']
+    found = np.flatnonzero((rel >= 0) & (rel != unknown_id)).tolist()
+    return [(e1s[i], relations[rel[i]], e2s[i]) for i in found]
@@ -0,0 +1,139 @@
+# Valutazione vettorizzata delle estrazioni di SELector (richiede numpy)
+# Relazioni della ground truth e relazioni estratte vengono codificate una sola volta in id
+# interi, un mapping della ground truth (gt_map) diventa una piccola matrice booleana
+# (classi della ground truth x relazioni): precision, recall ed F1 micro e macro, conteggi
+# per relazione e matrice di confusione si ottengono con bincount e indicizzazione,
+# più mapping vengono valutati sulla stessa estrazione senza ricodificare
+import numpy as np
+
+
+UNKNOWN = 'unknown'
+
+
+# Codifica una lista di etichette: (vocabolario, id di ogni etichetta)
+def encode_labels(labels):
+
+    vocab, ids = np.unique(np.asarray(labels, dtype=object), return_inverse=True)
+    return vocab.tolist(), ids
+
+
+# Divisione che restituisce 0 se il denominatore è 0 (come evaluate)
+def safe_div(num, den):
+
+    num, den = np.asarray(num, dtype=float), np.asarray(den, dtype=float)
+    return np.divide(num, den, out=np.zeros_like(num), where=den != 0)
+
+
+# F1 da precision e recall (0 se entrambe sono 0)
+def fscore(precision, recall):
+
+    return safe_div(2 * np.asarray(precision) * recall, np.asarray(precision) + recall)
+
+
+# Risultato della valutazione con un mapping della ground truth
+class Evaluation:
+
+    def __init__(self, relations, extracted, correct, relevant, n_extracted, n_correct, n_relevant,
+                 confusion, gold_labels):
+        self.relations = relations  # relazioni valutate (senza 'unknown')
+        self.extracted = extracted  # fatti estratti per relazione
+        self.correct = correct  # fatti estratti corretti per relazione
+        self.relevant = relevant  # fatti rilevanti nella ground truth per relazione
+        self.n_extracted, self.n_correct, self.n_relevant = n_extracted, n_correct, n_relevant
+
+        # Micro: stessi conteggi (e stessa semantica) di SELector.evaluate
+        self.precision = float(safe_div(n_correct, n_extracted))
+        self.recall = float(safe_div(n_correct, n_relevant))
+        self.fscore = float(fscore(self.precision, self.recall))
+
+        # Per relazione e macro (media sulle relazioni estratte o presenti nella ground truth)
+        self.relation_precision = safe_div(correct, extracted)
+        self.relation_recall = safe_div(correct, relevant)
+        self.relation_fscore = fscore(self.relation_precision, self.relation_recall)
+        active = (extracted > 0) | (relevant > 0)
+        if active.any():
+            self.macro_precision = float(self.relation_precision[active].mean())
+            self.macro_recall = float(self.relation_recall[active].mean())
+            self.macro_fscore = float(self.relation_fscore[active].mean())
+        else:
+            self.macro_precision = self.macro_recall = self.macro_fscore = 0.0
+
+        # Matrice di confusione: righe etichette della ground truth, colonne relazioni estratte
+        self.confusion = confusion
+        self.gold_labels = gold_labels
+        self.predicted_labels = [UNKNOWN] + list(relations)
+
+    def micro(self):
+        return self.precision, self.recall, self.fscore
+
+    def macro(self):
+        return self.macro_precision, self.macro_recall, self.macro_fscore
+
+    # Metriche e conteggi {rel: {...}} per ogni relazione valutata
+    def per_relation(self):
+        return {rel: {'extracted': int(self.extracted[i]),
+                      'correct': int(self.correct[i]),
+                      'relevant': int(self.relevant[i]),
+                      'precision': float(self.relation_precision[i]),
+                      'recall': float(self.relation_recall[i]),
+                      'fscore': float(self.relation_fscore[i])}
+                for i, rel in enumerate(self.relations)}
+
+
+# Valutazione di una estrazione già codificata con un mapping della ground truth
+# gold_vocab/gold_ids: relazioni del file di test, pred_vocab/pred_ids: relazioni estratte
+def evaluate_encoded(gold_vocab, gold_ids, pred_vocab, pred_ids, gt_map=None):
+
+    # Relazioni valutate, colonna 0 riservata a 'unknown'
+    if gt_map:
+        relations = list(dict.fromkeys(r for rels in gt_map.values() for r in rels if r != UNKNOWN))
+    else:
+        relations = sorted(set(gold_vocab).union(pred_vocab) - {UNKNOWN})
+    rel_index = {rel: j + 1 for j, rel in enumerate(relations)}
+    n_labels = len(relations) + 1
+
+    # Relazioni estratte fuori dal mapping diventano 'unknown'
+    pred_map = np.array([rel_index.get(rel, 0) for rel in pred_vocab], dtype=np.int64)
+    pred = pred_map[pred_ids]
+
+    # Relazioni corrette per ogni etichetta della ground truth (matrice booleana piccola)
+    truth = np.zeros((len(gold_vocab), n_labels), dtype=bool)
+    relevant_gold = np.zeros(len(gold_vocab), dtype=bool)
+    for g, label in enumerate(gold_vocab):
+        true_relations = gt_map.get(label, [UNKNOWN]) if gt_map else [label]
+        truth[g, [rel_index.get(rel, 0) for rel in true_relations]] = True
+        relevant_gold[g] = list(true_relations) != [UNKNOWN]
+
+    extracted = pred != 0
+    correct = extracted & truth[gold_ids, pred]
+    relevant = relevant_gold[gold_ids]
+
+    # Conteggi per relazione
+    extracted_r = np.bincount(pred, minlength=n_labels)
+    correct_r = np.bincount(pred[correct], minlength=n_labels)
+    relevant_r = np.bincount(gold_ids[relevant], minlength=len(gold_vocab)) @ truth
+
+    confusion = np.bincount(gold_ids * n_labels + pred, minlength=len(gold_vocab) * n_labels)
+    confusion = confusion.reshape(len(gold_vocab), n_labels)
+
+    return Evaluation(relations, extracted_r[1:], correct_r[1:], relevant_r[1:],
+                      int(extracted.sum()), int(correct.sum()), int(relevant.sum()),
+                      confusion, gold_vocab)
+
+
+# Valuta più mapping {nome: gt_map} (gt_map None: nessun mapping) su un'unica estrazione
+# gold: relazioni del file di test, predicted: relazioni estratte (stesso ordine)
+def evaluate_many(gold, predicted, gt_maps):
+
+    assert len(gold) == len(predicted), 'Ground truth and harvested facts must have the same length.'
+    gold_vocab, gold_ids = encode_labels(gold)
+    pred_vocab, pred_ids = encode_labels(predicted)
+
+    return {name: evaluate_encoded(gold_vocab, gold_ids, pred_vocab, pred_ids, gt_map)
+            for name, gt_map in gt_maps.items()}
+
+
+# Valutazione con un solo mapping della ground truth
+def evaluate(gold, predicted, gt_map=None):
+
+    return evaluate_many(gold, predicted, {None: gt_map})[None]
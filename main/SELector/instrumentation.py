@@ -0,0 +1,199 @@
+# Strumentazione per stadi di SELector (train, harvest)
+# Ogni stadio (caricamento tsv, distant supervision, sottocampionamento, normalizzazione,
+# build_model_triples, ...) è un context manager che misura tempo reale, tempo CPU, righe
+# in ingresso e in uscita, RSS del processo e, con trace_memory=True, il picco di memoria
+# Python (tracemalloc). Ogni stadio produce un record JSON su una riga (chiavi ordinate,
+# confrontabili tra esecuzioni) scritto su file, su uno stream o passato ad una callback
+# NULL_RECORDER (default di SELector) non misura nulla: stage() restituisce sempre lo
+# stesso context manager vuoto, tracemalloc non viene avviato
+# Uso: slc = SELector(recorder=StageRecorder('train.jsonl', run='baseline'))
+#      python instrumentation.py baseline.jsonl candidate.jsonl  (confronto tra due esecuzioni)
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:
+    resource = None  # non disponibile su Windows
+
+
+# Contesto vuoto dei recorder disattivati
+class NullStage:
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **fields):
+        pass
+
+
+NULL_STAGE = NullStage()
+
+
+class NullRecorder:
+
+    enabled = False
+
+    def stage(self, name, rows_in=None):
+        return NULL_STAGE
+
+
+NULL_RECORDER = NullRecorder()
+
+
+# RSS corrente (byte), None se non disponibile
+def current_rss():
+
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+# Picco di RSS del processo (byte), None se non disponibile
+def peak_rss():
+
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024  # Linux in KB, macOS in byte
+
+
+class Stage:
+
+    def __init__(self, recorder, name, rows_in=None):
+        self.recorder = recorder
+        self.record = {'run': recorder.run, 'stage': name, 'rows_in': rows_in, 'rows_out': None}
+        self.child_peak = 0  # picco tracemalloc degli stadi annidati
+
+    # Il picco di tracemalloc viene azzerato solo se la sessione appartiene al recorder,
+    # altrimenti il picco dello stadio è il picco della sessione meno la memoria all'ingresso
+    # (il picco del chiamante non viene toccato, lo stadio può ereditarne uno precedente)
+    def __enter__(self):
+        recorder = self.recorder
+        self.record['depth'] = len(recorder.stack)
+        if recorder.trace_memory:
+            current, peak = tracemalloc.get_traced_memory()
+            if recorder._started_tracing:
+                if recorder.stack:
+                    parent = recorder.stack[-1]
+                    parent.child_peak = max(parent.child_peak, peak)
+                tracemalloc.reset_peak()
+            self.traced_start = current
+        recorder.stack.append(self)
+        self.wall_start = time.perf_counter()
+        self.cpu_start = time.process_time()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        wall = time.perf_counter() - self.wall_start
+        cpu = time.process_time() - self.cpu_start
+        recorder = self.recorder
+        recorder.stack.pop()
+        record = self.record
+        record.update(wall_s=round(wall, 6), cpu_s=round(cpu, 6), rss_bytes=current_rss(), rss_peak_bytes=peak_rss())
+        if recorder.trace_memory and tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            peak = max(peak, self.child_peak)
+            record.update(py_peak_bytes=peak - self.traced_start, py_delta_bytes=current - self.traced_start)
+            if recorder._started_tracing and recorder.stack:
+                parent = recorder.stack[-1]
+                parent.child_peak = max(parent.child_peak, peak)
+        if exc_type is not None:
+            record['error'] = exc_type.__name__
+        recorder.emit(record)
+        return False
+
+    # Righe in uscita ed eventuali campi aggiuntivi dello stadio
+    def set(self, **fields):
+        self.record.update(fields)
+
+
+# Registra gli stadi come righe JSON
+# output: path (aggiunge in coda), stream con write() o None; callback: funzione(record)
+# Senza output e callback i record restano in memoria (records), altrimenti records è None
+# (nessuna lista che cresce per tutta la vita di un recorder di lunga durata, e.g. server)
+# trace_memory=True avvia tracemalloc (rallenta l'esecuzione) per il picco di memoria Python
+class StageRecorder:
+
+    enabled = True
+
+    def __init__(self, output=None, callback=None, run=None, trace_memory=False):
+        self.output = output
+        self.callback = callback
+        self.run = run
+        self.trace_memory = trace_memory
+        self.records = list() if output is None and callback is None else None
+        self.stack = list()
+        self._started_tracing = False  # tracemalloc avviato da questo recorder
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+
+    def stage(self, name, rows_in=None):
+        return Stage(self, name, rows_in)
+
+    def emit(self, record):
+        if self.records is not None:
+            self.records.append(record)
+        if self.output is not None:
+            line = json.dumps(record, sort_keys=True) + '\n'
+            if isinstance(self.output, str):
+                with open(self.output, 'a', encoding='utf8') as out_file:
+                    out_file.write(line)
+            else:
+                self.output.write(line)
+        if self.callback is not None:
+            self.callback(record)
+
+    # Ferma tracemalloc solo se avviato dal recorder (non una sessione del chiamante o di un altro recorder)
+    def close(self):
+        if self._started_tracing and tracemalloc.is_tracing():
+            tracemalloc.stop()
+        self._started_tracing = False
+
+
+# Legge i record di un file JSON lines, eventualmente di una sola esecuzione
+def read_records(file_path, run=None):
+
+    with open(file_path, 'r', encoding='utf8') as in_file:
+        records = [json.loads(line) for line in in_file if line.strip()]
+    if run is not None:
+        records = [r for r in records if r.get('run') == run]
+    return records
+
+
+# Confronta due esecuzioni stadio per stadio (stadi con lo stesso nome nello stesso ordine)
+# restituisce [(stadio, valore prima, valore dopo, rapporto), ...] per la metrica indicata
+def compare(before, after, metric='wall_s'):
+
+    def keyed(records):
+        seen, result = dict(), dict()
+        for r in records:
+            n = seen[r['stage']] = seen.get(r['stage'], 0) + 1
+            result[(r['stage'], n)] = r.get(metric)
+        return result
+
+    old, new = keyed(before), keyed(after)
+    rows = list()
+    for key in list(old) + [k for k in new if k not in old]:
+        a, b = old.get(key), new.get(key)
+        ratio = b / a if a and b is not None else None
+        rows.append((key[0], a, b, ratio))
+    return rows
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 3:
+        print('Uso: python instrumentation.py <prima.jsonl> <dopo.jsonl> [metrica]')
+        sys.exit(1)
+    metric = sys.argv[3] if len(sys.argv) > 3 else 'wall_s'
+    for stage, a, b, ratio in compare(read_records(sys.argv[1]), read_records(sys.argv[2]), metric):
+        print(f'{stage:<24}{a!s:>16}{b!s:>16}{(f"{ratio:.2f}x" if ratio is not None else "-"):>10}')
@@ -0,0 +1,157 @@
+# Client e load test per il server di estrazione di SELector (server.py)
+# ExtractionClient: client asyncio con connessione keep-alive (TCP o socket Unix)
+# Il load test apre `concurrency` client concorrenti che inviano richieste di
+# `triples_per_request` triple prese dal file di input, riporta latenza p50/p99 (esatte,
+# misurate dal client), throughput e le metriche del server (istogrammi di latenza e batch)
+# Senza --url/--unix avvia nello stesso processo un server locale sul modello indicato
+# Uso: python load_test.py <text_triples.tsv> [--model <modello> [--tsv] | --port 8080 | --unix path]
+#                          [--concurrency 64] [--requests 5000] [--triples-per-request 1]
+import argparse
+import asyncio
+import csv
+import json
+import time
+
+try:
+    from .server import ExtractionServer, load
+except ImportError:
+    from server import ExtractionServer, load
+
+
+class ExtractionClient:
+
+    def __init__(self, host='127.0.0.1', port=8080, unix_path=None):
+        self.host = host
+        self.port = port
+        self.unix_path = unix_path
+        self.reader = self.writer = None
+
+    async def connect(self):
+        if self.unix_path:
+            self.reader, self.writer = await asyncio.open_unix_connection(self.unix_path)
+        else:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            await self.writer.wait_closed()
+            self.reader = self.writer = None
+
+    async def request(self, method, path, payload=None):
+        if self.writer is None:
+            await self.connect()
+        body = json.dumps(payload).encode('utf8') if payload is not None else b''
+        self.writer.write(f'{method} {path} HTTP/1.1\r\nHost: {self.host}\r\nContent-Type: application/json\r\n'
+                          f'Content-Length: {len(body)}\r\n\r\n'.encode('latin1') + body)
+        await self.writer.drain()
+
+        status = (await self.reader.readline()).decode('latin1').split(' ', 2)[1]
+        length = 0
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin1').partition(':')
+            if name.strip().lower() == 'content-length':
+                length = int(value)
+        data = json.loads(await self.reader.readexactly(length))
+        assert status == '200', f'Server error {status}: {data}'
+        return data
+
+    # Fatti [(e1, rel, e2), ...] estratti da una lista di text triples
+    async def predict(self, triples):
+        data = await self.request('POST', '/predict', {'triples': [list(t) for t in triples]})
+        return [tuple(f) for f in data['facts']]
+
+    async def metrics(self):
+        return await self.request('GET', '/metrics')
+
+
+# Percentile esatto di una lista ordinata di valori
+def percentile(values, q):
+
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(q / 100 * len(values)))]
+
+
+# Esegue il load test, restituisce un dizionario con latenze, throughput e metriche del server
+async def run(triples, host='127.0.0.1', port=8080, unix_path=None, concurrency=64, num_requests=5000, triples_per_request=1):
+
+    requests = [[triples[(i * triples_per_request + j) % len(triples)] for j in range(triples_per_request)]
+                for i in range(num_requests)]
+    latencies = list()
+
+    async def worker(offset):
+        client = ExtractionClient(host, port, unix_path)
+        try:
+            for i in range(offset, num_requests, concurrency):
+                start = time.perf_counter()
+                await client.predict(requests[i])
+                latencies.append((time.perf_counter() - start) * 1000)
+        finally:
+            await client.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*[worker(offset) for offset in range(concurrency)])
+    elapsed = time.perf_counter() - start
+
+    client = ExtractionClient(host, port, unix_path)
+    server_metrics = await client.metrics()
+    await client.close()
+
+    latencies.sort()
+    return {'requests': num_requests, 'concurrency': concurrency, 'seconds': elapsed,
+            'requests_per_s': num_requests / elapsed,
+            'triples_per_s': num_requests * triples_per_request / elapsed,
+            'p50_ms': percentile(latencies, 50), 'p99_ms': percentile(latencies, 99),
+            'server': server_metrics}
+
+
+# Load test contro un server avviato nello stesso processo su una porta libera
+async def run_local(model, triples, max_batch_size=64, max_wait_ms=2.0, **kwargs):
+
+    server = ExtractionServer(model, max_batch_size, max_wait_ms)
+    await server.start(port=0)
+    try:
+        return await run(triples, port=server.port(), **kwargs)
+    finally:
+        await server.close()
+
+
+def print_report(report):
+
+    print(f"Richieste: {report['requests']} (concorrenza {report['concurrency']}) in {report['seconds']:.2f}s")
+    print(f"Throughput: {report['requests_per_s']:.0f} richieste/s, {report['triples_per_s']:.0f} triple/s")
+    print(f"Latenza client: p50 {report['p50_ms']:.2f} ms, p99 {report['p99_ms']:.2f} ms")
+    batch = report['server']['batch_size']
+    latency = report['server']['latency_ms']
+    print(f"Server: {batch['count']} batch, dimensione media {batch['mean']:.1f}, "
+          f"latenza p50 <= {latency['p50']} ms, p99 <= {latency['p99']} ms")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Load test for the SELector extraction server')
+    parser.add_argument('input', help='text triples tsv (phr, e1, t1, e2, t2)')
+    parser.add_argument('--model', default=None, help='modello da servire in locale (senza server esterno)')
+    parser.add_argument('--tsv', action='store_true')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--unix', default=None)
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--triples-per-request', type=int, default=1)
+    parser.add_argument('--max-batch-size', type=int, default=64)
+    parser.add_argument('--max-wait-ms', type=float, default=2.0)
+    args = parser.parse_args()
+
+    with open(args.input, 'r', encoding='utf8') as tsv_file:
+        triples = [tuple(record[:5]) for record in csv.reader(tsv_file, delimiter='\t')]
+
+    options = dict(concurrency=args.concurrency, num_requests=args.requests, triples_per_request=args.triples_per_request)
+    if args.model:
+        report = asyncio.run(run_local(load(args.model, args.tsv), triples, args.max_batch_size, args.max_wait_ms, **options))
+    else:
+        report = asyncio.run(run(triples, args.host, args.port, args.unix, **options))
+    print_report(report)
@@ -0,0 +1,153 @@
+# Indice MinHash LSH per la ricerca di pattern quasi duplicati (richiede numpy)
+# Una phrase mai vista non ha corrispondenza esatta tra i pattern del modello: l'indice
+# cerca il pattern noto con gli stessi tipi (t1, t2) e la phrase più simile (Jaccard sui
+# token) sopra una soglia. Le firme MinHash sono divise in bande (LSH banding), due phrases
+# finiscono nello stesso bucket di una banda con probabilità crescente con la similarità:
+# la ricerca confronta solo i candidati dei bucket (tempo sublineare nel numero di pattern)
+# e la similarità dei candidati viene poi verificata in modo esatto
+import pickle
+import zlib
+import numpy as np
+
+
+DEFAULT_NUM_PERM = 64
+
+# Primo di Mersenne 2^31 - 1: (a * x + b) resta entro 64 bit
+PRIME = (1 << 31) - 1
+
+# Dimensione dei blocchi di phrases per il calcolo vettorizzato delle firme
+SIGNATURE_BLOCK = 4096
+
+
+# Token di una phrase (le phrases sono già normalizzate o comunque separate da spazi)
+def tokenize(phr):
+
+    return frozenset(phr.split())
+
+
+# Sceglie bande e righe per banda (bands * rows = num_perm): la soglia approssimata
+# dell'LSH (1 / bands) ^ (1 / rows) è la più alta che non supera quella richiesta,
+# così i falsi negativi restano pochi e i falsi positivi vengono scartati dalla verifica
+def choose_bands(num_perm, threshold):
+
+    best = None
+    for rows in range(1, num_perm + 1):
+        if num_perm % rows:
+            continue
+        bands = num_perm // rows
+        approx = (1 / bands) ** (1 / rows)
+        if approx <= threshold and (best is None or approx > best[2]):
+            best = (bands, rows, approx)
+    if best is None:
+        return num_perm, 1
+
+    return best[0], best[1]
+
+
+class LSHIndex:
+
+    # model_triples [(phr, t1, t2, rel, count), ...], threshold: Jaccard minimo
+    def __init__(self, model_triples, threshold=0.5, num_perm=DEFAULT_NUM_PERM, seed=1):
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands, self.rows = choose_bands(num_perm, threshold)
+        rng = np.random.RandomState(seed)
+        self.a = rng.randint(1, PRIME, size=num_perm).astype(np.uint64)
+        self.b = rng.randint(0, PRIME, size=num_perm).astype(np.uint64)
+        # Coefficienti per ridurre una banda ad un unico intero (le collisioni vengono verificate)
+        self.band_coef = rng.randint(1, PRIME, size=self.rows).astype(np.uint64)
+
+        self.model_triples = list(model_triples)
+        self.tokens = [tokenize(t[0]) for t in self.model_triples]
+        self.groups = dict()  # {(t1, t2): id gruppo}
+        self.tables = [dict() for _ in range(self.bands)]  # per banda {(gruppo, chiave): [pattern]}
+
+        keys = self.band_keys(self.tokens)
+        for i, (_, t1, t2, _, _) in enumerate(self.model_triples):
+            if not self.tokens[i]:
+                continue
+            gid = self.groups.setdefault((t1, t2), len(self.groups))
+            for table, key in zip(self.tables, keys[i]):
+                try:
+                    table[(gid, key)].append(i)
+                except KeyError:
+                    table[(gid, key)] = [i]
+
+    def __len__(self):
+        return len(self.model_triples)
+
+    # Firme MinHash (n x num_perm) di una lista di insiemi di token, vettorizzate a blocchi
+    def signatures(self, token_sets):
+        sig = np.full((len(token_sets), self.num_perm), PRIME, dtype=np.uint64)
+        token_hash = dict()
+        for start in range(0, len(token_sets), SIGNATURE_BLOCK):
+            block = token_sets[start:start + SIGNATURE_BLOCK]
+            hashes, owners = list(), list()
+            for i, tokens in enumerate(block):
+                for token in tokens:
+                    try:
+                        h = token_hash[token]
+                    except KeyError:
+                        h = token_hash[token] = zlib.crc32(token.encode('utf8')) % PRIME
+                    hashes.append(h)
+                    owners.append(i)
+            if not hashes:
+                continue
+            x = np.array(hashes, dtype=np.uint64)
+            h = (x[:, None] * self.a + self.b) % PRIME
+            owners = np.array(owners)
+            starts = np.flatnonzero(np.r_[True, owners[1:] != owners[:-1]])
+            sig[start + owners[starts]] = np.minimum.reduceat(h, starts, axis=0)
+        return sig
+
+    # Chiavi delle bande [[chiave banda 0, ...], ...] di una lista di insiemi di token
+    def band_keys(self, token_sets):
+        sig = self.signatures(token_sets).reshape(len(token_sets), self.bands, self.rows)
+        return (sig * self.band_coef).sum(axis=2).tolist()
+
+    # Pattern noti più simili ad una lista di pattern [(phr, t1, t2), ...]:
+    # per ognuno la model triple (phr, t1, t2, rel, count) più simile sopra la soglia o None
+    def query_many(self, patterns):
+        results = [None] * len(patterns)
+        if not patterns or not self.model_triples:
+            return results
+
+        # Firme calcolate una sola volta per phrase distinta
+        phrases = list(dict.fromkeys(p[0] for p in patterns))
+        token_sets = [tokenize(phr) for phr in phrases]
+        phrase_keys = dict(zip(phrases, zip(token_sets, self.band_keys(token_sets))))
+
+        for n, (phr, t1, t2) in enumerate(patterns):
+            gid = self.groups.get((t1, t2))
+            tokens, keys = phrase_keys[phr]
+            if gid is None or not tokens:
+                continue
+            candidates = set()
+            for table, key in zip(self.tables, keys):
+                candidates.update(table.get((gid, key), ()))
+            # Verifica esatta: Jaccard più alto, a parità il pattern più frequente (prima posizione)
+            best, best_sim = None, self.threshold
+            for i in sorted(candidates):
+                other = self.tokens[i]
+                sim = len(tokens & other) / len(tokens | other)
+                if sim > best_sim or (sim == best_sim and best is None):
+                    best, best_sim = i, sim
+            if best is not None:
+                results[n] = self.model_triples[best]
+
+        return results
+
+    # Pattern noto più simile ad un singolo pattern (phr, t1, t2) o None
+    def query(self, phr, t1, t2):
+        return self.query_many([(phr, t1, t2)])[0]
+
+    def save(self, file_path):
+        with open(file_path, 'wb') as pkl_file:
+            pickle.dump(self, pkl_file, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def load(file_path):
+        with open(file_path, 'rb') as pkl_file:
+            index = pickle.load(pkl_file)
+        assert isinstance(index, LSHIndex), f'{file_path} is not a SELector LSH index.'
+        return index
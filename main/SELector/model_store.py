@@ -0,0 +1,181 @@
+# Salvataggio e caricamento del modello SELector (model triples + iperparametri)
+# Due formati:
+# - tsv leggibile: una riga di intestazione '#SELector' con gli iperparametri in json
+#   (compreso il riassegnamento dei tipi) seguita dalle model triples
+# - binario: una cartella di array NumPy aperti in memory-map con un indice hash
+#   ad indirizzamento aperto sui pattern (phr, t1, t2), il caricamento non legge
+#   il modello ma apre solo i file, le righe vengono decodificate su richiesta
+#   (richiede numpy, il formato tsv no)
+from os.path import join, getsize
+import json
+import zlib
+import csv
+import os
+
+
+TSV_HEADER = '#SELector'
+MAPPED_FORMAT = 'selector-mmap'
+MAPPED_VERSION = 1
+
+
+# Chiave binaria di un pattern, usata per l'hash (le phrases non contengono tab)
+def pattern_key(phr, t1, t2):
+
+    return '\t'.join((phr, t1, t2)).encode('utf8')
+
+
+# Salva iperparametri e model triples [(phr, t1, t2, rel, count), ...] in un tsv
+def write_tsv(file_path, params, model_triples):
+
+    with open(file_path, 'w', encoding='utf8', newline='') as tsv_file:
+        tsv_file.write(f'{TSV_HEADER}\t{json.dumps(params)}\n')
+        wr = csv.writer(tsv_file, delimiter='\t', lineterminator='\n')
+        for phr, t1, t2, rel, count in model_triples:
+            wr.writerow([phr, t1, t2, rel, count])
+
+
+# Legge un modello salvato con write_tsv, restituisce (iperparametri, model triples)
+def read_tsv(file_path):
+
+    with open(file_path, 'r', encoding='utf8', newline='') as tsv_file:
+        header = tsv_file.readline().rstrip('\n').split('\t', 1)
+        assert header[0] == TSV_HEADER, f'{file_path} is not a SELector model file.'
+        params = json.loads(header[1])
+        rd = csv.reader(tsv_file, delimiter='\t')
+        model_triples = [(phr, t1, t2, rel, int(count)) for phr, t1, t2, rel, count in rd]
+
+    return params, model_triples
+
+
+# Salva il modello nel formato binario (cartella dir_path)
+def write_mapped(dir_path, params, model_triples):
+
+    import numpy as np
+
+    os.makedirs(dir_path, exist_ok=True)
+
+    # Pool di stringhe condiviso da frasi, tipi e relazioni
+    str2id, strings = dict(), list()
+    def encode(s):
+        try:
+            return str2id[s]
+        except KeyError:
+            str2id[s] = len(strings)
+            strings.append(s)
+            return str2id[s]
+
+    n = len(model_triples)
+    columns = {f: np.empty(n, dtype=np.int32) for f in ('phr', 't1', 't2', 'rel')}
+    counts = np.empty(n, dtype=np.int64)
+    hashes = np.empty(n, dtype=np.uint32)
+    for i, (phr, t1, t2, rel, count) in enumerate(model_triples):
+        columns['phr'][i], columns['t1'][i], columns['t2'][i] = encode(phr), encode(t1), encode(t2)
+        columns['rel'][i] = encode(rel)
+        counts[i] = count
+        hashes[i] = zlib.crc32(pattern_key(phr, t1, t2))
+
+    # Tabella hash ad indirizzamento aperto (probing lineare), fattore di carico <= 0.5
+    n_slots = 1
+    while n_slots < 2 * n:
+        n_slots *= 2
+    mask = n_slots - 1
+    slots = np.full(n_slots, -1, dtype=np.int32)
+    for i, h in enumerate(hashes.tolist()):
+        slot = h & mask
+        while slots[slot] >= 0:
+            slot = (slot + 1) & mask
+        slots[slot] = i
+
+    encoded = [s.encode('utf8') for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(b) for b in encoded])
+    with open(join(dir_path, 'strings.bin'), 'wb') as bin_file:
+        bin_file.write(b''.join(encoded))
+    np.save(join(dir_path, 'offsets.npy'), offsets)
+    for f, col in columns.items():
+        np.save(join(dir_path, f + '.npy'), col)
+    np.save(join(dir_path, 'count.npy'), counts)
+    np.save(join(dir_path, 'hash.npy'), hashes)
+    np.save(join(dir_path, 'slots.npy'), slots)
+
+    meta = {'format': MAPPED_FORMAT, 'version': MAPPED_VERSION, 'params': params,
+            'n_patterns': n, 'n_slots': n_slots}
+    with open(join(dir_path, 'meta.json'), 'w', encoding='utf8') as meta_file:
+        json.dump(meta, meta_file)
+
+
+# Modello binario aperto in memory-map, si comporta sia come lista di model triples
+# (len, iterazione, slicing) sia come indice dei pattern: model[(phr, t1, t2)] -> (rel, count)
+class MappedModel:
+
+    def __init__(self, dir_path):
+        import numpy as np
+
+        with open(join(dir_path, 'meta.json'), 'r', encoding='utf8') as meta_file:
+            meta = json.load(meta_file)
+        assert meta.get('format') == MAPPED_FORMAT, f'{dir_path} is not a SELector binary model.'
+        assert meta.get('version') == MAPPED_VERSION, f'Unsupported model version {meta.get("version")}.'
+        self.dir_path = dir_path
+        self.params = meta['params']
+        self.n_patterns = meta['n_patterns']
+
+        load = lambda name: np.load(join(dir_path, name + '.npy'), mmap_mode='r')
+        self.offsets = load('offsets')
+        self.phr, self.t1, self.t2, self.rel = load('phr'), load('t1'), load('t2'), load('rel')
+        self.count, self.hash, self.slots = load('count'), load('hash'), load('slots')
+        self.mask = len(self.slots) - 1
+        strings_path = join(dir_path, 'strings.bin')
+        if getsize(strings_path):
+            self.strings = np.memmap(strings_path, dtype=np.uint8, mode='r')
+        else:
+            self.strings = np.empty(0, dtype=np.uint8)
+
+    def __len__(self):
+        return self.n_patterns
+
+    # Stringa del pool con id i
+    def string(self, i):
+        return self.strings[self.offsets[i]:self.offsets[i + 1]].tobytes().decode('utf8')
+
+    # Model triple in posizione i: (phr, t1, t2, rel, count)
+    def row(self, i):
+        s = self.string
+        return (s(self.phr[i]), s(self.t1[i]), s(self.t2[i]), s(self.rel[i]), int(self.count[i]))
+
+    def __iter__(self):
+        for i in range(self.n_patterns):
+            yield self.row(i)
+
+    # Ricerca di un pattern nell'indice hash, restituisce la posizione o -1
+    def find(self, phr, t1, t2):
+        key = pattern_key(phr, t1, t2)
+        h = zlib.crc32(key)
+        slot = h & self.mask
+        while True:
+            i = int(self.slots[slot])
+            if i < 0:
+                return -1
+            if self.hash[i] == h and pattern_key(self.string(self.phr[i]), self.string(self.t1[i]), self.string(self.t2[i])) == key:
+                return i
+            slot = (slot + 1) & self.mask
+
+    def __getitem__(self, key):
+        # Accesso come indice dei pattern
+        if isinstance(key, tuple):
+            i = self.find(*key)
+            if i < 0:
+                raise KeyError(key)
+            return self.string(self.rel[i]), int(self.count[i])
+        # Accesso come lista di model triples
+        if isinstance(key, slice):
+            return [self.row(i) for i in range(self.n_patterns)[key]]
+        return self.row(range(self.n_patterns)[key])
+
+    def __contains__(self, pattern):
+        return self.find(*pattern) >= 0
+
+    def get(self, pattern, default=None):
+        try:
+            return self[pattern]
+        except KeyError:
+            return default
@@ -0,0 +1,118 @@
+# Estrazione parallela multi-processo per SELector
+# L'input viene partizionato in blocchi estratti da un pool di processi, i fatti
+# tornano nell'ordine dell'input. L'indice dei pattern non viene serializzato per
+# ogni blocco: con fork i processi figli lo condividono copy-on-write, altrimenti
+# ogni processo lo riceve una sola volta all'avvio (o riapre il modello binario in memory-map)
+from collections import deque
+import multiprocessing as mp
+import csv
+import io
+import os
+
+
+# Dimensione indicativa (byte) delle partizioni di un file di input
+PARTITION_BYTES = 16 * 1024 * 1024
+
+
+# Modello condiviso dai processi del pool
+_worker_model = None
+
+
+# Inizializzazione di un processo del pool (solo se non si può usare fork)
+def _init_worker(model=None, cls=None, model_dir=None):
+
+    global _worker_model
+    if model_dir is not None:
+        _worker_model = cls.load_model(model_dir)
+    elif model is not None:
+        _worker_model = model
+
+
+# Estrazione di un blocco già in memoria nel processo figlio
+def _harvest_chunk(chunk, keep_unknown):
+
+    return _worker_model.harvest_chunk(chunk, keep_unknown)
+
+
+# Estrazione di un intervallo di byte di un tsv, letto direttamente dal processo figlio
+def _harvest_range(file_path, start, end, keep_unknown):
+
+    with open(file_path, 'rb') as tsv_file:
+        tsv_file.seek(start)
+        data = tsv_file.read(end - start).decode('utf8')
+    chunk = [tuple(line) for line in csv.reader(io.StringIO(data), delimiter='\t')]
+
+    return _worker_model.harvest_chunk(chunk, keep_unknown)
+
+
+# Suddivide un file in intervalli di byte [(inizio, fine), ...] allineati all'inizio di una riga
+def split_file(file_path, n_parts):
+
+    size = os.path.getsize(file_path)
+    bounds = [0]
+    with open(file_path, 'rb') as tsv_file:
+        for i in range(1, n_parts):
+            tsv_file.seek(size * i // n_parts)
+            tsv_file.readline()
+            bounds.append(max(tsv_file.tell(), bounds[-1]))
+    bounds.append(size)
+
+    return [(start, end) for start, end in zip(bounds, bounds[1:]) if end > start]
+
+
+# Esegue i task [(funzione, argomenti), ...] sul pool e restituisce i fatti in ordine
+# Al più max_pending task sono in lavorazione contemporaneamente, così la memoria
+# resta limitata anche se l'input è molto più grande della RAM
+def _run(model, tasks, workers=None, max_pending=None):
+
+    global _worker_model
+
+    if not workers:
+        workers = mp.cpu_count()
+    if not max_pending:
+        max_pending = 2 * workers
+
+    # Gli indici vengono costruiti prima di avviare il pool così i processi li trovano pronti
+    if not model.encoded:
+        model.get_mt_map()
+        model.get_lsh_index()
+
+    if 'fork' in mp.get_all_start_methods():
+        ctx = mp.get_context('fork')
+        _worker_model = model
+        initargs = ()
+    else:
+        ctx = mp.get_context('spawn')
+        model_dir = getattr(model.mt_index, 'dir_path', None)
+        initargs = (None, type(model), model_dir) if model_dir else (model,)
+
+    try:
+        with ctx.Pool(workers, initializer=_init_worker, initargs=initargs) as pool:
+            pending = deque()
+            for func, args in tasks:
+                pending.append(pool.apply_async(func, args))
+                if len(pending) >= max_pending:
+                    yield from pending.popleft().get()
+            while pending:
+                yield from pending.popleft().get()
+    finally:
+        _worker_model = None
+
+
+# Estrae i fatti da blocchi di text triples già letti (generatore)
+def parallel_harvest(model, chunks, keep_unknown=False, workers=None):
+
+    tasks = ((_harvest_chunk, (chunk, keep_unknown)) for chunk in chunks)
+    yield from _run(model, tasks, workers)
+
+
+# Estrae i fatti da un tsv (generatore): il file viene partizionato in intervalli
+# di byte letti direttamente dai processi figli, il processo principale non legge
+# né serializza l'input
+def parallel_harvest_file(model, file_path, keep_unknown=False, workers=None):
+
+    if not workers:
+        workers = mp.cpu_count()
+    n_parts = max(4 * workers, os.path.getsize(file_path) // PARTITION_BYTES)
+    tasks = ((_harvest_range, (file_path, start, end, keep_unknown)) for start, end in split_file(file_path, n_parts))
+    yield from _run(model, tasks, workers)
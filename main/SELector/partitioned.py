@@ -0,0 +1,154 @@
+# Distant supervision out-of-core per SELector
+# Knowledge graph e text triples vengono partizionati su disco con un hash della coppia
+# (e1, e2), ogni partizione del kg contiene quindi tutti i fatti che possono etichettare
+# le text triples della partizione corrispondente. Il join procede un gruppo di partizioni
+# alla volta (in memoria solo la parte di kg_dict del gruppo, entro un budget di memoria)
+# e i conteggi parziali dei pattern vengono fusi in un unico dizionario
+from os.path import join, getsize
+import tempfile
+import shutil
+import zlib
+import math
+import csv
+
+
+# Stima della memoria occupata da kg_dict: byte per fatto oltre ai byte delle stringhe
+FACT_OVERHEAD = 400
+BYTE_FACTOR = 2
+
+# Stima (conservativa) del rapporto tra memoria di kg_dict e dimensione del tsv,
+# serve solo a scegliere il numero di partizioni prima di leggere il kg
+KG_MEMORY_FACTOR = 32
+
+# Numero di partizioni se il kg non è un file (dimensione non nota in anticipo)
+DEFAULT_PARTITIONS = 64
+MAX_PARTITIONS = 512
+
+
+# Partizione di una coppia di entità
+def partition_of(e1, e2, n_parts):
+
+    return zlib.crc32(f'{e1}\t{e2}'.encode('utf8')) % n_parts
+
+
+# Sceglie il numero di partizioni in base al budget di memoria (byte)
+def choose_partitions(kg_source, memory_budget):
+
+    if type(kg_source) is not str:
+        return DEFAULT_PARTITIONS
+    n_parts = math.ceil(getsize(kg_source) * KG_MEMORY_FACTOR / memory_budget)
+
+    return min(max(n_parts, 1), MAX_PARTITIONS)
+
+
+# Dimensione dei blocchi letti (record): anche i blocchi in lettura devono stare nel budget
+def choose_chunk_size(memory_budget, max_chunk_size):
+
+    return max(1000, min(max_chunk_size, memory_budget // (4 * FACT_OVERHEAD)))
+
+
+# Cartella temporanea con i file di spill delle partizioni
+class SpillDir:
+
+    def __init__(self, n_parts, spill_dir=None):
+        self.n_parts = n_parts
+        self.path = tempfile.mkdtemp(prefix='selector_spill_', dir=spill_dir)
+        self.kg_facts = [0] * n_parts  # fatti per partizione
+        self.kg_bytes = [0] * n_parts  # byte per partizione
+
+    def file_path(self, name, part):
+        return join(self.path, f'{name}_{part}.tsv')
+
+    # Scrive le righe nei file delle partizioni, key(riga) -> (e1, e2)
+    # Restituisce il numero di righe per partizione
+    def spill(self, name, chunks, key):
+        files = [open(self.file_path(name, p), 'w', encoding='utf8', newline='') for p in range(self.n_parts)]
+        counts = [0] * self.n_parts
+        try:
+            writers = [csv.writer(f, delimiter='\t', lineterminator='\n') for f in files]
+            for chunk in chunks:
+                for row in chunk:
+                    p = partition_of(*key(row), self.n_parts)
+                    writers[p].writerow(row)
+                    counts[p] += 1
+        finally:
+            for f in files:
+                f.close()
+        return counts
+
+    # Partiziona i fatti del kg [(h, r, t), ...]
+    def spill_kg(self, kg_chunks):
+        self.kg_facts = self.spill('kg', kg_chunks, lambda fact: (fact[0], fact[2]))
+        self.kg_bytes = [getsize(self.file_path('kg', p)) for p in range(self.n_parts)]
+
+    # Partiziona le text triples già ridotte a (riga, campionata, phr, t1, t2, e1, e2)
+    def spill_text(self, text_chunks):
+        return self.spill('text', text_chunks, lambda row: (row[5], row[6]))
+
+    # Raggruppa partizioni consecutive finché la stima della memoria del kg resta nel budget
+    def groups(self, memory_budget=None):
+        group, size = list(), 0
+        for p in range(self.n_parts):
+            part_size = self.kg_facts[p] * FACT_OVERHEAD + self.kg_bytes[p] * BYTE_FACTOR
+            if group and memory_budget and size + part_size > memory_budget:
+                yield group
+                group, size = list(), 0
+            group.append(p)
+            size += part_size
+        if group:
+            yield group
+
+    # Legge una partizione come blocchi di tuple
+    def read(self, name, part, chunk_size):
+        with open(self.file_path(name, part), 'r', encoding='utf8', newline='') as tsv_file:
+            rd = csv.reader(tsv_file, delimiter='\t')
+            chunk = list()
+            for line in rd:
+                chunk.append(tuple(line))
+                if len(chunk) >= chunk_size:
+                    yield chunk
+                    chunk = list()
+            if chunk:
+                yield chunk
+
+    def close(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+
+
+# Fonde i conteggi parziali {pattern: {rel: [count, prima occorrenza]}} in pattern2relc
+def merge_counts(pattern2relc, partial):
+
+    for pattern, rel_counts in partial.items():
+        counts = pattern2relc.get(pattern)
+        if counts is None:
+            pattern2relc[pattern] = rel_counts
+            continue
+        for rel, (count, first) in rel_counts.items():
+            try:
+                rc = counts[rel]
+                rc[0] += count
+                rc[1] = min(rc[1], first)
+            except KeyError:
+                counts[rel] = [count, first]
+
+
+# Converte i conteggi fusi nel formato {pattern: {rel: count}} di build_model_triples
+# Pattern e relazioni seguono l'ordine di prima occorrenza delle labeled, con 'unknown'
+# in coda, come nell'addestramento classico: stessi pareggi di max(...)
+# I pattern senza labeled non possono entrare nel modello e vengono scartati
+def ordered_counts(pattern2relc):
+
+    labeled = list()
+    for pattern, counts in pattern2relc.items():
+        firsts = [first for rel, (_, first) in counts.items() if rel != 'unknown']
+        if firsts:
+            labeled.append((min(firsts), pattern))
+    labeled.sort(key=lambda t: t[0])
+
+    ordered = dict()
+    for _, pattern in labeled:
+        counts = pattern2relc[pattern]
+        rels = sorted(counts, key=lambda rel: (rel == 'unknown', counts[rel][1]))
+        ordered[pattern] = {rel: counts[rel][0] for rel in rels}
+
+    return ordered
@@ -0,0 +1,112 @@
+# Conteggi completi pattern x relazione di SELector come matrice sparsa CSR (richiede scipy)
+# build_model_triples conserva solo la relazione più frequente di ogni pattern: la matrice
+# mantiene tutti i conteggi (righe i pattern, colonne le relazioni compreso 'unknown') e
+# argmax, soglie di supporto e confidenza e top-k diventano operazioni vettorizzate,
+# ricavare le model triples con soglie diverse non richiede un nuovo addestramento
+# A parità di conteggio vince la relazione inserita per prima nel pattern, come max(...)
+# sul dizionario {rel: count} in select_model_triples
+import numpy as np
+
+
+UNKNOWN = 'unknown'
+
+
+class PatternCounts:
+
+    # patterns: [(phr, t1, t2), ...], relations: [rel, ...], matrix: csr (patterns x relations)
+    # con le colonne di ogni riga nell'ordine di inserimento delle relazioni
+    def __init__(self, patterns, relations, matrix):
+        self.patterns = patterns
+        self.relations = relations
+        self.matrix = matrix
+        self.unknown_col = relations.index(UNKNOWN) if UNKNOWN in relations else -1
+
+        # Ordine delle relazioni di ogni riga: conteggio decrescente, poi ordine di inserimento
+        # (calcolato una volta, non dipende da eventuali riordinamenti successivi della matrice)
+        indptr, indices, data = matrix.indptr, matrix.indices, matrix.data
+        lengths = np.diff(indptr)
+        rows = np.repeat(np.arange(len(patterns)), lengths)
+        rank = np.arange(len(data)) - indptr[rows]
+        order = np.lexsort((rank, -data, rows))
+        self.row_start = indptr[:-1]
+        self.row_length = lengths
+        self.row_of = None  # {pattern: riga}, costruito alla prima richiesta
+        self.sorted_cols = indices[order]
+        self.sorted_counts = data[order]
+        self.totals = np.add.reduceat(data, self.row_start) if len(data) else np.zeros(0, dtype=data.dtype)
+
+    # Costruisce la matrice dal dizionario {(phr, t1, t2) -> {rel: count}}
+    @classmethod
+    def from_dict(cls, pattern2relc):
+        from scipy.sparse import csr_matrix
+
+        rel_index = dict()
+        indptr, indices, data = [0], list(), list()
+        for counts in pattern2relc.values():
+            for rel, count in counts.items():
+                try:
+                    indices.append(rel_index[rel])
+                except KeyError:
+                    rel_index[rel] = len(rel_index)
+                    indices.append(rel_index[rel])
+                data.append(count)
+            indptr.append(len(indices))
+
+        shape = (len(pattern2relc), len(rel_index))
+        matrix = csr_matrix((np.array(data, dtype=np.int64), np.array(indices, dtype=np.int32),
+                             np.array(indptr, dtype=np.int64)), shape=shape)
+
+        return cls(list(pattern2relc), list(rel_index), matrix)
+
+    def __len__(self):
+        return len(self.patterns)
+
+    # Relazione più frequente di ogni pattern: (colonne, conteggi)
+    def argmax(self):
+        return self.sorted_cols[self.row_start], self.sorted_counts[self.row_start]
+
+    # Confidenza di ogni pattern: conteggio della relazione più frequente / conteggio totale
+    def confidence(self):
+        _, best = self.argmax()
+        return best / self.totals
+
+    # Maschera dei pattern che entrano nel modello con le soglie indicate
+    def select(self, min_count=1, min_confidence=0.0):
+        cols, counts = self.argmax()
+        mask = (cols != self.unknown_col) & (counts >= min_count)
+        if min_confidence:
+            mask &= counts >= min_confidence * self.totals
+        return mask
+
+    # Model triples [(phr, t1, t2, rel, count), ...] ordinate per conteggio decrescente
+    # (a parità nell'ordine dei pattern), con le soglie di default coincidono con
+    # quelle di select_model_triples + ordinamento di build_model_triples
+    def model_triples(self, min_count=1, min_confidence=0.0):
+        cols, counts = self.argmax()
+        rows = np.flatnonzero(self.select(min_count, min_confidence))
+        rows = rows[np.argsort(-counts[rows], kind='stable')]
+        patterns = self.patterns
+        relations = np.array(self.relations, dtype=object)[cols[rows]].tolist()
+
+        return [patterns[r] + (rel, n) for r, rel, n in zip(rows.tolist(), relations, counts[rows].tolist())]
+
+    # Prime k relazioni di ogni pattern: (colonne, conteggi) di forma (pattern, k),
+    # -1 e 0 dove un pattern ha meno di k relazioni
+    def top_k(self, k):
+        n = len(self.patterns)
+        cols = np.full((n, k), -1, dtype=np.int64)
+        counts = np.zeros((n, k), dtype=self.sorted_counts.dtype)
+        for j in range(k):
+            has = self.row_length > j
+            cols[has, j] = self.sorted_cols[self.row_start[has] + j]
+            counts[has, j] = self.sorted_counts[self.row_start[has] + j]
+        return cols, counts
+
+    # Prime k relazioni di un pattern [(rel, count), ...]
+    def top_relations(self, pattern, k=3):
+        if self.row_of is None:
+            self.row_of = {p: r for r, p in enumerate(self.patterns)}
+        r = self.row_of[pattern]
+        start = self.row_start[r]
+        end = start + min(k, self.row_length[r])
+        return [(self.relations[c], n) for c, n in zip(self.sorted_cols[start:end].tolist(), self.sorted_counts[start:end].tolist())]
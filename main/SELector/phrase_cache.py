@@ -0,0 +1,119 @@
+# Cache delle phrases normalizzate (chiave: phrase originale)
+# Le phrases si ripetono molto tra le text triples e tra train e harvest: la cache tiene le
+# più recenti in memoria (LRU, capacity phrases) e, se viene indicato un path, tutte le
+# phrases già normalizzate in un database SQLite che sopravvive tra le esecuzioni.
+# Solo le phrases mai viste arrivano al normalizzatore (e.g. nlp.pipe di spaCy)
+# namespace separa le normalizzazioni di normalizzatori diversi (e.g. il backend) nella stessa cache
+from collections import OrderedDict
+import os
+import sqlite3
+
+
+DEFAULT_CAPACITY = 200000
+
+# Numero massimo di parametri per query SQLite
+SQL_BATCH = 500
+
+
+class PhraseCache:
+
+    def __init__(self, path=None, capacity=DEFAULT_CAPACITY, namespace='spacy'):
+        self.path = path
+        self.capacity = capacity
+        self.namespace = namespace
+        self.lru = OrderedDict()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.conn = None
+        self.pid = None
+
+    # Connessione al database, riaperta nei processi figli (una connessione non sopravvive al fork)
+    def connect(self):
+        if self.path is None:
+            return None
+        if self.conn is None or self.pid != os.getpid():
+            self.conn = sqlite3.connect(self.path)
+            self.pid = os.getpid()
+            self.conn.execute('PRAGMA journal_mode=WAL')
+            self.conn.execute('PRAGMA synchronous=NORMAL')
+            self.conn.execute('CREATE TABLE IF NOT EXISTS phrases (namespace TEXT, raw TEXT, norm TEXT, '
+                              'PRIMARY KEY (namespace, raw)) WITHOUT ROWID')
+        return self.conn
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state['conn'] = None
+        return state
+
+    def __len__(self):
+        return len(self.lru)
+
+    def remember(self, key, norm):
+        self.lru[key] = norm
+        self.lru.move_to_end(key)
+        if len(self.lru) > self.capacity:
+            self.lru.popitem(last=False)
+
+    # Phrases normalizzate già note {raw: norm} tra quelle richieste (distinte)
+    def get_many(self, phrases, namespace=None):
+        namespace = namespace or self.namespace
+        found = dict()
+        missing = list()
+        for raw in phrases:
+            try:
+                found[raw] = self.lru[(namespace, raw)]
+                self.lru.move_to_end((namespace, raw))
+            except KeyError:
+                missing.append(raw)
+        self.memory_hits += len(found)
+
+        conn = self.connect()
+        if conn is not None and missing:
+            for start in range(0, len(missing), SQL_BATCH):
+                batch = missing[start:start + SQL_BATCH]
+                query = f'SELECT raw, norm FROM phrases WHERE namespace = ? AND raw IN ({",".join("?" * len(batch))})'
+                for raw, norm in conn.execute(query, [namespace] + batch):
+                    found[raw] = norm
+                    self.remember((namespace, raw), norm)
+                    self.disk_hits += 1
+
+        self.misses += len(phrases) - len(found)
+        return found
+
+    def put_many(self, pairs, namespace=None):
+        namespace = namespace or self.namespace
+        pairs = list(pairs)
+        for raw, norm in pairs:
+            self.remember((namespace, raw), norm)
+        conn = self.connect()
+        if conn is not None and pairs:
+            with conn:
+                conn.executemany('INSERT OR REPLACE INTO phrases VALUES (?, ?, ?)',
+                                 [(namespace, raw, norm) for raw, norm in pairs])
+
+    # Normalizza una lista di phrases con la cache: normalizer(lista di phrases mai viste)
+    # restituisce le phrases normalizzate nello stesso ordine; risultato allineato all'input
+    def normalize(self, phrases, normalizer, namespace=None):
+        unique = list(dict.fromkeys(phrases))
+        found = self.get_many(unique, namespace)
+        unseen = [raw for raw in unique if raw not in found]
+        if unseen:
+            norms = normalizer(unseen)
+            self.put_many(zip(unseen, norms), namespace)
+            found.update(zip(unseen, norms))
+        return [found[raw] for raw in phrases]
+
+    def stats(self):
+        hits = self.memory_hits + self.disk_hits
+        lookups = hits + self.misses
+        return {'memory_hits': self.memory_hits, 'disk_hits': self.disk_hits, 'misses': self.misses,
+                'hit_rate': hits / lookups if lookups else 0.0, 'cached': len(self.lru)}
+
+    def clear(self):
+        self.lru.clear()
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
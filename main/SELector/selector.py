@@ -2,21 +2,57 @@
 # Questo modulo definisce l'oggetto SELector, un modello per l'estrazione di relazioni.
 # I metodi esposti che si consiglia di usare sono:
 # train(...) addestra il modello
-# predict(...) predice un singolo fatto
+# predict(...) / predict_one(...) predice un singolo fatto
+# predict_many(...) predice una lista di fatti sull'indice già costruito
+# update(...) addestramento incrementale con nuove text triples e nuovi fatti del kg
+# rederive(...) ricava le model triples con soglie di supporto e confidenza diverse (keep_counts)
 # harvest(...) estrazione di tutti i fatti
+# iter_harvest(...) estrazione di tutti i fatti in streaming (generatore)
+# harvest_columnar(...) estrazione di tutti i fatti come join vettorizzato (pandas)
 # evaluate(...) valutazione prestazioni, precision e recall
-# save_to_tsv(...) salva lo stato del modello in un tsv (non ancora implementato) 
+# evaluate_report(...) / evaluate_many(...) metriche micro e macro, per relazione e matrice di confusione
+# save_to_tsv(...) / load_from_tsv(...) salva e carica il modello in un tsv leggibile
+# save_model(...) / load_model(...) salva e carica il modello in formato binario (memory-map)
 # show_list(...) mostra il contenuto di una struttura dati interna o di una lista 
 
 #from text_preprocessing import text_triples_norm
 
-from os.path import sep
+try:
+    from .streaming import read_chunks, is_streaming, DEFAULT_CHUNK_SIZE
+    from .instrumentation import NULL_RECORDER
+except ImportError:
+    from streaming import read_chunks, is_streaming, DEFAULT_CHUNK_SIZE
+    from instrumentation import NULL_RECORDER
+
+from os.path import sep, join, exists
+import importlib
+import inspect
 import random
 import csv
 
+
+# Import ritardato dei moduli opzionali di SELector (e.g. encoding richiede NumPy)
+# funziona sia importando il package SELector sia eseguendo dalla sua cartella
+# File dell'indice LSH nella cartella del modello binario
+LSH_FILE = 'lsh_index.pkl'
+
+
+def _lazy_import(name):
+    if __package__:
+        return importlib.import_module('.' + name, __package__)
+    return importlib.import_module(name)
+
+
+# Prima occorrenza labeled (riga, posizione) di un pattern dai conteggi dell'addestramento
+# incrementale {rel: [count, (riga, posizione)]}, i pattern con sole unlabeled vanno in fondo
+def _first_labeled(counts):
+    return min((c[1] for rel, c in counts.items() if rel != 'unknown'), default=(float('inf'),))
+
+
 class SELector:
     
-    def __init__(self, rseed=None, unlabeled_sub=0.5, no_types=False, type_remapping=None, enable_LP=None):
+    def __init__(self, rseed=None, unlabeled_sub=0.5, no_types=False, type_remapping=None, enable_LP=None, encoded=False,
+                 lsh_threshold=None, keep_counts=False, recorder=None):
 
         # Stato modello
         self.model_state = 'NOT READY'
@@ -29,6 +65,12 @@ class SELector:
             self.no_types = False  # Specificare un riassegnamento forza l'utilizzo dei tipi
         self.type_remapping = type_remapping  # Riassegna i tipi in base ad un mapping (generalizza tipi)        
         self.enable_LP = enable_LP 
+        self.encoded = encoded  # tabelle interne codificate ad interi (colonne NumPy) invece che tuple di stringhe
+        self.lsh_threshold = lsh_threshold  # Jaccard minimo per il fallback sui pattern simili (None disabilitato)
+        self.keep_counts = keep_counts  # conserva tutti i conteggi pattern x relazione (matrice sparsa, scipy)
+
+        # Strumentazione per stadi di train e harvest (instrumentation.StageRecorder), di default disattivata
+        self.recorder = recorder if recorder is not None else NULL_RECORDER
         
         # Strutture dati 
         self.text_triples = []
@@ -36,6 +78,25 @@ class SELector:
         self.labeled_triples = []
         self.unlabeled_triples = []
         self.model_triples = []
+        self.pattern_counts = None  # conteggi completi pattern x relazione (pattern_counts.PatternCounts)
+
+        # Strutture modalità codificata (vocabolari, riassegnazione tipi su id, indice pattern)
+        self.vocabs = None
+        self.type_remap_ids = None
+        self.pattern_index = None
+
+        # Indice hash sui pattern, costruito una sola volta dopo train o caricamento
+        # (o già pronto se il modello binario è caricato in memory-map)
+        self.mt_index = None
+        self.column_index = None  # indice per l'estrazione colonnare (harvest_columnar)
+        self.lsh_index = None  # indice MinHash LSH dei pattern per le phrases mai viste (lsh_threshold)
+
+        # Stato dell'addestramento incrementale (update), None se il modello non è incrementale
+        self.pattern2relc = None  # {(phr, t1, t2) -> {rel: [count, prima occorrenza]}} di tutto il corpus visto
+        self.inc_kg_dict = None  # {(h, t): {rel: None}} di tutti i fatti del kg visti (insieme ordinato)
+        self.pair_index = None  # {(e1, e2): [(pattern, campionata, riga), ...]} di tutte le text triples viste
+        self.inc_rows = 0  # numero di text triples viste
+        self.inc_rng = None  # generatore per il sottocampionamento delle nuove unlabeled
 
 
     # Gestisce il caricamento da tsv, in una lista
@@ -47,17 +108,25 @@ class SELector:
                 dest.append(tuple(line))
                 
 
-    # Genera le tabelle Labeled e Unlabeled Triples con Distant Supervision
-    def distant_supervision(self):
-        # Carica kg in struttura ottimizzata per ricerca
-        kg_dict = dict() # NOTA: il KG potrebbe essere caricato direttamente in questa struttura        
-        for h, r, t in self.knowledge_graph:
-            try:
-                kg_dict[(h,t)].add(r)
-            except:
-                kg_dict[(h,t)] = set([r])
+    # Carica il kg in una struttura ottimizzata per la ricerca {(h, t): relazioni}
+    # kg_chunks è un iterabile di blocchi di fatti [[(h, r, t), ...], ...]
+    def build_kg_dict(self, kg_chunks):
+
+        kg_dict = dict()
+        for chunk in kg_chunks:
+            for h, r, t in chunk:
+                try:
+                    kg_dict[(h,t)].add(r)
+                except:
+                    kg_dict[(h,t)] = set([r])
+
+        return kg_dict
+
+
+    # Smista le text triples in labeled e unlabeled in base alle coppie presenti in kg_dict
+    def label_triples(self, text_triples, kg_dict, labeled, unlabeled):
         # Iterazione a singolo ciclo for e accesso diretto
-        for phr, e1, t1, e2, t2 in self.text_triples:
+        for phr, e1, t1, e2, t2 in text_triples:
             # Riassegnazione tipi
             if self.type_remapping:
                 try:
@@ -71,23 +140,27 @@ class SELector:
                     triple = (phr, e1, t1, e2, t2, rel)
                     if self.no_types:
                         triple = (phr, e1, '', e2, '', rel)
-                    self.labeled_triples.append(triple)
+                    labeled.append(triple)
             except:
                 triple = (phr, e1, t1, e2, t2, 'unknown')
                 if self.no_types:
                     triple = (phr, e1, '', e2, '', 'unknown')
-                self.unlabeled_triples.append(triple)
+                unlabeled.append(triple)
+
+
+    # Genera le tabelle Labeled e Unlabeled Triples con Distant Supervision
+    def distant_supervision(self):
+        # Carica kg in struttura ottimizzata per ricerca
+        kg_dict = self.build_kg_dict([self.knowledge_graph])
+        self.label_triples(self.text_triples, kg_dict, self.labeled_triples, self.unlabeled_triples)
         # In effetti mantenere gli id delle entità non servirebbe per la fase successiva ma...
         # ...solo se la pipeline fosse quella originale, volendo usare Link Prediction gli id sono necessari. 
 
 
-    # Costruisce la tabella necessaria per estrarre fatti
-    def build_model_triples(self):
+    # Aggiorna il dizionario {(phr, t1, t2) -> {rel1: count, rel1: count}} con le triple passate
+    def count_patterns(self, triples, pattern2relc):
 
-        # Dizionario da labeled e unlabeled {(phr, t1, t2) -> {rel1: count, rel1: count}}
-        all_triples = self.labeled_triples + self.unlabeled_triples
-        pattern2relc = dict()
-        for phr, _, t1, _, t2, rel in all_triples:
+        for phr, _, t1, _, t2, rel in triples:
             try:
                 counts = pattern2relc[(phr, t1, t2)]
                 try:
@@ -97,25 +170,369 @@ class SELector:
             except:
                 pattern2relc[(phr, t1, t2)] = {rel: 1}
 
+        return pattern2relc
+
+
+    # Seleziona da pattern2relc le model triples [(phr, t1, t2, rel, count), ...]
+    def select_model_triples(self, pattern2relc):
+
         # Max val key su ciascuna chiave per assegnare relazione
+        model_triples = list()
         for pattern, counts in pattern2relc.items():
             phr, t1, t2 = pattern
             rel = max(counts, key=counts.get) # Qui viene scelta la relazione con "max count" da associare al pattern
             if rel != 'unknown':
                 triple = (phr, t1, t2, rel, counts[rel])
-                self.model_triples.append(triple)
+                model_triples.append(triple)
+
+        return model_triples
+
+
+    # Costruisce la tabella necessaria per estrarre fatti
+    def build_model_triples(self, pattern2relc=None):
+
+        # Dizionario da labeled e unlabeled {(phr, t1, t2) -> {rel1: count, rel1: count}}
+        if pattern2relc is None:
+            pattern2relc = self.count_patterns(self.labeled_triples, dict())
+            self.count_patterns(self.unlabeled_triples, pattern2relc)
+
+        # Max val key su ciascuna chiave per assegnare relazione (con keep_counts argmax
+        # vettorizzato sulla matrice dei conteggi, che resta disponibile per rederive)
+        if self.keep_counts:
+            self.pattern_counts = _lazy_import('pattern_counts').PatternCounts.from_dict(pattern2relc)
+            self.model_triples += self.pattern_counts.model_triples()
+        else:
+            self.model_triples += self.select_model_triples(pattern2relc)
+        self.invalidate_index() # Il modello è cambiato, gli indici vanno ricostruiti
 
         # Ordina pattern per occorrenza decrescente
         self.model_triples.sort(key=lambda t: t[4], reverse=True)
 
-    
+
+    # Genera blocco per blocco le coppie (labeled, unlabeled) già sottocampionate
+    # Il sottocampionamento è per riga (probabilità unlabeled_sub) perché in streaming
+    # il numero totale di unlabeled non è noto in anticipo
+    def iter_training_chunks(self, input_text_triples, kg_dict, chunk_size=None):
+
+        rng = random.Random(self.rseed) # Deterministico, usa rseed=None per seed casuali
+        for chunk in read_chunks(input_text_triples, chunk_size):
+            labeled, unlabeled = list(), list()
+            self.label_triples(chunk, kg_dict, labeled, unlabeled)
+            unlabeled = [triple for triple in unlabeled if rng.random() < self.unlabeled_sub]
+            if self.enable_LP and unlabeled:
+                from link_prediction import link_predict
+                unlabeled = link_predict(unlabeled, self.enable_LP)
+            yield labeled, unlabeled
+
+
+    # Addestramento in streaming: distant supervision, sottocampionamento e conteggio
+    # dei pattern consumano i blocchi in pipeline, senza materializzare le tabelle intermedie
+    def train_stream(self, input_text_triples, input_knowledge_graph, chunk_size=None):
+
+        print('Caricamento knowledge graph a blocchi...', end='', flush=True)
+        with self.recorder.stage('load_kg') as stage:
+            kg_dict = self.build_kg_dict(read_chunks(input_knowledge_graph, chunk_size))
+            stage.set(rows_out=len(kg_dict))
+        print('Fatto.', flush=True)
+
+        print('Distant supervision, sottocampionamento e conteggio pattern a blocchi...', end='', flush=True)
+        with self.recorder.stage('distant_supervision') as stage:
+            pattern2relc = dict()
+            for labeled, unlabeled in self.iter_training_chunks(input_text_triples, kg_dict, chunk_size):
+                self.count_patterns(labeled, pattern2relc)
+                self.count_patterns(unlabeled, pattern2relc)
+            del(kg_dict)
+            stage.set(rows_out=len(pattern2relc))
+        print('Fatto.', flush=True)
+
+        print('Generazione delle triple del modello...', end='', flush=True)
+        with self.recorder.stage('build_model_triples', rows_in=len(pattern2relc)) as stage:
+            self.build_model_triples(pattern2relc)
+            stage.set(rows_out=len(self.model_triples))
+        print('Fatto.', flush=True)
+
+        # Modello pronto per estrarre fatti
+        self.model_state = 'READY'
+
+
+    # Addestramento in modalità codificata: frasi, entità, tipi e relazioni vengono
+    # mappati su id int32 e le tabelle interne sono colonne NumPy (EncodedTable)
+    # Distant supervision e conteggio pattern lavorano su interi, stesso risultato della versione a stringhe
+    def train_encoded(self, input_text_triples, input_knowledge_graph, chunk_size=None):
+
+        enc = _lazy_import('encoding')
+        self.vocabs = enc.Vocabularies()
+
+        print('Caricamento e codifica text triples...', end='', flush=True)
+        with self.recorder.stage('load_text') as stage:
+            self.text_triples = enc.EncodedTable.from_chunks(enc.TEXT_FIELDS, self.vocabs, read_chunks(input_text_triples, chunk_size))
+            stage.set(rows_out=len(self.text_triples))
+        print('Fatto.', flush=True)
+
+        print('Caricamento e codifica knowledge graph...', end='', flush=True)
+        with self.recorder.stage('load_kg') as stage:
+            self.knowledge_graph = enc.EncodedTable.from_chunks(('h', 'r', 't'), self.vocabs, read_chunks(input_knowledge_graph, chunk_size))
+            stage.set(rows_out=len(self.knowledge_graph))
+        print('Fatto.', flush=True)
+
+        # Distant Supervision come join su interi
+        print('Generazione training set con distant supervision...', end='', flush=True)
+        with self.recorder.stage('distant_supervision', rows_in=len(self.text_triples)) as stage:
+            if self.type_remapping:
+                self.type_remap_ids = enc.encode_type_remapping(self.type_remapping, self.vocabs.types)
+            self.labeled_triples, self.unlabeled_triples = enc.supervise_tables(
+                self.text_triples, self.knowledge_graph, self.type_remap_ids, self.no_types, unique_relations=True)
+            stage.set(rows_out=len(self.labeled_triples) + len(self.unlabeled_triples))
+        print('Fatto.', flush=True)
+
+        # Sottocampionamento unlabeled triples, stessi indici di random.sample sulla lista
+        print('Sottocampionamento casuale delle triple non etichettate...', end='', flush=True)
+        with self.recorder.stage('subsampling', rows_in=len(self.unlabeled_triples)) as stage:
+            num_sample = int(len(self.unlabeled_triples) * self.unlabeled_sub)
+            random.seed(self.rseed) # Deterministico, usa rseed=None per seed casuali
+            sample = random.sample(range(len(self.unlabeled_triples)), k=num_sample)
+            self.unlabeled_triples = self.unlabeled_triples.take(sample)
+            stage.set(rows_out=len(self.unlabeled_triples))
+        print('Fatto.', flush=True)
+
+        # Link prediction sulle unlabeled (lavora su stringhe, decodifica e ricodifica)
+        if self.enable_LP and len(self.unlabeled_triples):
+            print('Link prediction...', end='', flush=True)
+            with self.recorder.stage('link_prediction', rows_in=len(self.unlabeled_triples)) as stage:
+                from link_prediction import link_predict
+                predicted = link_predict(list(self.unlabeled_triples), self.enable_LP)
+                self.unlabeled_triples = enc.EncodedTable.from_chunks(enc.TRIPLE_FIELDS, self.vocabs, [predicted])
+                stage.set(rows_out=len(self.unlabeled_triples))
+            print('Fatto.', flush=True)
+
+        # Costruisce la tabella che serve per le predizioni
+        print('Generazione delle triple del modello...', end='', flush=True)
+        with self.recorder.stage('build_model_triples', rows_in=len(self.labeled_triples) + len(self.unlabeled_triples)) as stage:
+            self.model_triples = enc.build_model_table(self.labeled_triples, self.unlabeled_triples)
+            self.pattern_index = enc.PatternIndex(self.model_triples)
+            stage.set(rows_out=len(self.model_triples))
+        print('Fatto.', flush=True)
+
+        # Modello pronto per estrarre fatti
+        self.model_state = 'READY'
+
+
+    # Genera per ogni text triple il pattern (phr, t1, t2) e la coppia di entità (e1, e2)
+    def iter_text_patterns(self, input_text_triples, chunk_size=None):
+
+        for chunk in read_chunks(input_text_triples, chunk_size):
+            for phr, e1, t1, e2, t2 in chunk:
+                # Riassegnazione tipi
+                if self.type_remapping:
+                    try:
+                        t1 = self.type_remapping[t1]
+                        t2 = self.type_remapping[t2]
+                    except:
+                        pass
+                if self.no_types:
+                    t1, t2 = '', ''
+                yield (phr, t1, t2), (e1, e2)
+
+
+    # Genera per ogni text triple il pattern (phr, t1, t2) e le relazioni del kg
+    # associate alla coppia (e1, e2), None se la tripla è unlabeled
+    def iter_supervised_patterns(self, input_text_triples, kg_dict, chunk_size=None):
+
+        for pattern, pair in self.iter_text_patterns(input_text_triples, chunk_size):
+            yield pattern, kg_dict.get(pair)
+
+
+    # Addestramento fuso: distant supervision, sottocampionamento e conteggio pattern
+    # aggiornano direttamente pattern2relc senza materializzare labeled e unlabeled
+    # Il risultato è identico all'addestramento classico (stessi indici di random.sample)
+    def train_fused(self, input_text_triples, input_knowledge_graph, chunk_size=None):
+
+        print('Caricamento knowledge graph...', end='', flush=True)
+        with self.recorder.stage('load_kg') as stage:
+            kg_dict = self.build_kg_dict(read_chunks(input_knowledge_graph, chunk_size))
+            stage.set(rows_out=len(kg_dict))
+        print('Fatto.', flush=True)
+
+        # Primo passaggio: le labeled vengono contate subito, delle unlabeled serve solo il numero
+        print('Distant supervision e conteggio pattern...', end='', flush=True)
+        with self.recorder.stage('distant_supervision') as stage:
+            pattern2relc = dict()
+            num_unlabeled = 0
+            for pattern, rels in self.iter_supervised_patterns(input_text_triples, kg_dict, chunk_size):
+                if rels is None:
+                    num_unlabeled += 1
+                    continue
+                for rel in rels:
+                    try:
+                        counts = pattern2relc[pattern]
+                        try:
+                            counts[rel] += 1
+                        except:
+                            counts[rel] = 1
+                    except:
+                        pattern2relc[pattern] = {rel: 1}
+            stage.set(rows_out=len(pattern2relc), unlabeled=num_unlabeled)
+        print('Fatto.', flush=True)
+
+        # Sottocampionamento: random.sample sceglie gli indici in base alla sola lunghezza
+        print('Sottocampionamento casuale delle triple non etichettate...', end='', flush=True)
+        with self.recorder.stage('subsampling', rows_in=num_unlabeled) as stage:
+            num_sample = int(num_unlabeled * self.unlabeled_sub)
+            random.seed(self.rseed) # Deterministico, usa rseed=None per seed casuali
+            selected = sorted(random.sample(range(num_unlabeled), k=num_sample))
+
+            # Secondo passaggio sulle sole unlabeled selezionate: 'unknown' serve solo ai pattern
+            # che hanno anche labeled, gli altri non possono entrare nel modello
+            if selected and pattern2relc:
+                i, n = 0, 0
+                for pattern, rels in self.iter_supervised_patterns(input_text_triples, kg_dict, chunk_size):
+                    if rels is not None:
+                        continue
+                    if n == selected[i]:
+                        counts = pattern2relc.get(pattern)
+                        if counts is not None:
+                            counts['unknown'] = counts.get('unknown', 0) + 1
+                        i += 1
+                        if i == len(selected):
+                            break
+                    n += 1
+            del(kg_dict, selected)
+            stage.set(rows_out=num_sample)
+        print('Fatto.', flush=True)
+
+        # Costruisce la tabella che serve per le predizioni
+        print('Generazione delle triple del modello...', end='', flush=True)
+        with self.recorder.stage('build_model_triples', rows_in=len(pattern2relc)) as stage:
+            self.build_model_triples(pattern2relc)
+            stage.set(rows_out=len(self.model_triples))
+        print('Fatto.', flush=True)
+
+        # Modello pronto per estrarre fatti
+        self.model_state = 'READY'
+
+
+    # Addestramento out-of-core per kg più grandi della memoria: kg e text triples vengono
+    # partizionati su disco (spill_dir, di default la cartella temporanea) per hash della
+    # coppia (e1, e2) e il join procede un gruppo di partizioni alla volta, la parte di kg_dict
+    # in memoria resta entro memory_budget (byte, stima). I conteggi parziali dei pattern
+    # vengono fusi mantenendo i pareggi dell'addestramento classico
+    # Le unlabeled sono sottocampionate per riga (probabilità unlabeled_sub) come in streaming
+    def train_partitioned(self, input_text_triples, input_knowledge_graph, memory_budget, chunk_size=None, spill_dir=None):
+
+        assert not self.encoded and not self.enable_LP, 'Out-of-core training does not support encoded mode and link prediction.'
+        part = _lazy_import('partitioned')
+        if not chunk_size:
+            chunk_size = part.choose_chunk_size(memory_budget, DEFAULT_CHUNK_SIZE)
+
+        # Text triples ridotte a (riga, campionata, phr, t1, t2, e1, e2), il campionamento
+        # avviene prima del join perché l'ordine delle righe tra le partizioni si perde
+        def spill_rows():
+            rng = random.Random(self.rseed) # Deterministico, usa rseed=None per seed casuali
+            for row, (pattern, pair) in enumerate(self.iter_text_patterns(input_text_triples, chunk_size)):
+                yield (row, int(rng.random() < self.unlabeled_sub)) + pattern + pair
+
+        spill = part.SpillDir(part.choose_partitions(input_knowledge_graph, memory_budget), spill_dir)
+        try:
+            print(f'Partizionamento knowledge graph e text triples ({spill.n_parts} partizioni)...', end='', flush=True)
+            with self.recorder.stage('partition') as stage:
+                spill.spill_kg(read_chunks(input_knowledge_graph, chunk_size))
+                spill.spill_text([spill_rows()])
+                stage.set(partitions=spill.n_parts)
+            print('Fatto.', flush=True)
+
+            print('Distant supervision e conteggio pattern per partizione...', end='', flush=True)
+            with self.recorder.stage('distant_supervision') as stage:
+                pattern2relc = dict()
+                for group in spill.groups(memory_budget):
+                    kg_dict = self.build_kg_dict(chunk for p in group for chunk in spill.read('kg', p, chunk_size))
+                    # Conteggi {pattern: {rel: [count, prima occorrenza]}}, le righe sono in ordine
+                    # crescente in ogni partizione quindi la prima occorrenza è la prima vista
+                    for p in group:
+                        partial = dict()
+                        for chunk in spill.read('text', p, chunk_size):
+                            for row, sampled, phr, t1, t2, e1, e2 in chunk:
+                                rels = kg_dict.get((e1,e2))
+                                if rels is not None:
+                                    counts = partial.setdefault((phr, t1, t2), dict())
+                                    for i, rel in enumerate(rels):
+                                        try:
+                                            counts[rel][0] += 1
+                                        except:
+                                            counts[rel] = [1, (int(row), i)]
+                                elif sampled == '1':
+                                    counts = partial.setdefault((phr, t1, t2), dict())
+                                    try:
+                                        counts['unknown'][0] += 1
+                                    except:
+                                        counts['unknown'] = [1, (int(row), 0)]
+                        part.merge_counts(pattern2relc, partial)
+                    del(kg_dict, partial)
+                stage.set(rows_out=len(pattern2relc))
+            print('Fatto.', flush=True)
+        finally:
+            spill.close()
+
+        # Costruisce la tabella che serve per le predizioni
+        print('Generazione delle triple del modello...', end='', flush=True)
+        with self.recorder.stage('build_model_triples', rows_in=len(pattern2relc)) as stage:
+            self.build_model_triples(part.ordered_counts(pattern2relc))
+            stage.set(rows_out=len(self.model_triples))
+        print('Fatto.', flush=True)
+
+        # Modello pronto per estrarre fatti
+        self.model_state = 'READY'
+
+
     # Addestramento modello
-    def train(self, input_text_triples, input_knowledge_graph):
+    # Di default l'addestramento è fuso e non conserva le tabelle intermedie (text, labeled e
+    # unlabeled triples), keep_tables=True le materializza per ispezionarle
+    # chunk_size (o un input che sia un iterabile generico) attiva l'ingestione a blocchi
+    # incremental=True conserva i conteggi dei pattern per aggiornare il modello con update(...)
+    # memory_budget (byte) attiva la distant supervision out-of-core per kg più grandi della memoria
+    def train(self, input_text_triples, input_knowledge_graph, chunk_size=None, keep_tables=False, incremental=False,
+              memory_budget=None, spill_dir=None):
+
+        # Un eventuale indice caricato da disco non corrisponde più al modello
+        self.invalidate_index()
+        self.pattern_counts = None
+
+        # Addestramento incrementale: un update a partire da un modello vuoto
+        if incremental:
+            self.model_triples = []
+            self.model_state = 'NOT READY'
+            self.init_incremental()
+            self.update(input_text_triples, input_knowledge_graph, chunk_size)
+            return
+        self.clear_incremental()
+
+        # Out-of-core: kg e text triples partizionati su disco, join una partizione alla volta
+        if memory_budget:
+            self.train_partitioned(input_text_triples, input_knowledge_graph, memory_budget, chunk_size, spill_dir)
+            return
+
+        # Modalità codificata: le tabelle diventano colonne di id interi
+        if self.encoded:
+            self.train_encoded(input_text_triples, input_knowledge_graph, chunk_size)
+            return
+
+        # Motore fuso: path e liste possono essere letti due volte, nessuna tabella intermedia
+        # (la link prediction lavora sulla lista delle unlabeled e richiede il percorso classico)
+        rereadable = isinstance(input_text_triples, (str, list, tuple))
+        if rereadable and not keep_tables and not self.enable_LP:
+            self.train_fused(input_text_triples, input_knowledge_graph, chunk_size)
+            return
+
+        # Streaming: la memoria dipende dalla dimensione del blocco e non dal corpus
+        if is_streaming(input_text_triples, chunk_size):
+            self.train_stream(input_text_triples, input_knowledge_graph, chunk_size)
+            return
 
         # Se viene passato un path carica da file altrimenti assegna
         if type(input_text_triples) is str:
             print('Caricamento text triples in corso...', end='', flush=True)
-            self.load_tsv(input_text_triples, self.text_triples,)
+            with self.recorder.stage('load_text') as stage:
+                self.load_tsv(input_text_triples, self.text_triples,)
+                stage.set(rows_out=len(self.text_triples))
             print('Fatto.', flush=True)
         else:
             self.text_triples = input_text_triples
@@ -123,33 +540,43 @@ class SELector:
         # Se viene passato un path carica da file altrimenti assegna
         if type(input_knowledge_graph) is str:
             print('Caricamento knowledge graph in corso...', end='', flush=True)
-            self.load_tsv(input_knowledge_graph, self.knowledge_graph)
+            with self.recorder.stage('load_kg') as stage:
+                self.load_tsv(input_knowledge_graph, self.knowledge_graph)
+                stage.set(rows_out=len(self.knowledge_graph))
             print('Fatto.', flush=True)
         else:
             self.knowledge_graph = input_knowledge_graph
 
         # Distant Supervision (INSERIRE LINK PREDICTION QUI oppure...)
         print('Generazione training set con distant supervision...', end='', flush=True)
-        self.distant_supervision()
+        with self.recorder.stage('distant_supervision', rows_in=len(self.text_triples)) as stage:
+            self.distant_supervision()
+            stage.set(rows_out=len(self.labeled_triples) + len(self.unlabeled_triples))
         print('Fatto.', flush=True)
 
         # Sottocampionamento unlabeled triples (...INSERIRE LINK PREDICTION QUI)
         print('Sottocampionamento casuale delle triple non etichettate...', end='', flush=True)
-        num_sample = int(len(self.unlabeled_triples) * self.unlabeled_sub)
-        random.seed(self.rseed) # Deterministico, usa rseed=None per seed casuali
-        self.unlabeled_triples = random.sample(self.unlabeled_triples, k=num_sample)
+        with self.recorder.stage('subsampling', rows_in=len(self.unlabeled_triples)) as stage:
+            num_sample = int(len(self.unlabeled_triples) * self.unlabeled_sub)
+            random.seed(self.rseed) # Deterministico, usa rseed=None per seed casuali
+            self.unlabeled_triples = random.sample(self.unlabeled_triples, k=num_sample)
+            stage.set(rows_out=len(self.unlabeled_triples))
         print('Fatto.', flush=True)
 
         # Link prediction sulle unlabeled
         if self.enable_LP and self.unlabeled_triples:
             print('Link prediction...', end='', flush=True)
-            from link_prediction import link_predict
-            self.unlabeled_triples = link_predict(self.unlabeled_triples, self.enable_LP)
+            with self.recorder.stage('link_prediction', rows_in=len(self.unlabeled_triples)) as stage:
+                from link_prediction import link_predict
+                self.unlabeled_triples = link_predict(self.unlabeled_triples, self.enable_LP)
+                stage.set(rows_out=len(self.unlabeled_triples))
             print('Fatto.', flush=True)
 
         # Costruisce la tabella che serve per le predizioni
         print('Generazione delle triple del modello...', end='', flush=True)
-        self.build_model_triples()
+        with self.recorder.stage('build_model_triples', rows_in=len(self.labeled_triples) + len(self.unlabeled_triples)) as stage:
+            self.build_model_triples()
+            stage.set(rows_out=len(self.model_triples))
         print('Fatto.', flush=True)
         
         # Elimina le strutture ausiliarie
@@ -161,6 +588,149 @@ class SELector:
         self.model_state = 'READY'
 
 
+    # Inizializza lo stato vuoto dell'addestramento incrementale
+    def init_incremental(self):
+
+        self.pattern2relc = dict()
+        self.inc_kg_dict = dict()
+        self.pair_index = dict()
+        self.inc_rows = 0
+        self.inc_rng = random.Random(self.rseed) # Deterministico, usa rseed=None per seed casuali
+
+
+    # Elimina lo stato dell'addestramento incrementale (il modello non è più aggiornabile)
+    def clear_incremental(self):
+
+        self.pattern2relc = None
+        self.inc_kg_dict = None
+        self.pair_index = None
+        self.inc_rows = 0
+        self.inc_rng = None
+
+
+    # Addestramento incrementale: aggiorna il modello con nuove text triples e/o nuovi fatti del kg
+    # senza rileggere il corpus, il costo dipende dalla dimensione del delta
+    # I nuovi fatti rietichettano le text triples già viste con la stessa coppia (e1, e2),
+    # le nuove text triples aggiungono conteggi e solo i pattern coinvolti ricalcolano la relazione
+    # Le nuove unlabeled sono sottocampionate per riga (probabilità unlabeled_sub) come in streaming
+    def update(self, new_text_triples=None, new_kg_facts=None, chunk_size=None):
+
+        assert not self.encoded and not self.enable_LP, 'Incremental training does not support encoded mode and link prediction.'
+        if self.pattern2relc is None:
+            assert self.model_state != 'READY', 'Model not incremental, please train it with incremental=True.'
+            self.init_incremental()
+
+        pattern2relc, kg_dict, pair_index = self.pattern2relc, self.inc_kg_dict, self.pair_index
+        affected = dict() # Pattern coinvolti in ordine di arrivo (non nell'ordine dell'hash)
+
+        # Nuovi fatti: le text triples della coppia ricevono la nuova relazione, quelle che
+        # erano unlabeled (e sono state campionate) perdono il conteggio 'unknown'
+        if new_kg_facts is not None:
+            for chunk in read_chunks(new_kg_facts, chunk_size):
+                for h, r, t in chunk:
+                    rels = kg_dict.get((h,t))
+                    was_labeled = rels is not None
+                    if was_labeled:
+                        if r in rels:
+                            continue # Fatto già noto
+                        rels[r] = None
+                    else:
+                        kg_dict[(h,t)] = rels = {r: None}
+                    for pattern, sampled, row in pair_index.get((h,t), ()):
+                        counts = pattern2relc.setdefault(pattern, dict())
+                        if sampled and not was_labeled:
+                            counts['unknown'][0] -= 1
+                            if not counts['unknown'][0]:
+                                del counts['unknown']
+                        # Occorrenza (riga, posizione del fatto tra quelli della coppia)
+                        first = (row, len(rels) - 1)
+                        try:
+                            rc = counts[r]
+                            rc[0] += 1
+                            rc[1] = min(rc[1], first)
+                        except:
+                            counts[r] = [1, first]
+                        affected[pattern] = None
+
+        # Nuove text triples: distant supervision sul kg visto finora e conteggio dei pattern
+        if new_text_triples is not None:
+            rng = self.inc_rng
+            row = self.inc_rows
+            for pattern, pair in self.iter_text_patterns(new_text_triples, chunk_size):
+                rels = kg_dict.get(pair)
+                sampled = False
+                if rels is not None:
+                    counts = pattern2relc.setdefault(pattern, dict())
+                    for i, rel in enumerate(rels):
+                        try:
+                            counts[rel][0] += 1
+                        except:
+                            counts[rel] = [1, (row, i)]
+                    affected[pattern] = None
+                elif rng.random() < self.unlabeled_sub:
+                    sampled = True
+                    counts = pattern2relc.setdefault(pattern, dict())
+                    try:
+                        counts['unknown'][0] += 1
+                    except:
+                        counts['unknown'] = [1, (row, 0)]
+                    affected[pattern] = None
+                try:
+                    pair_index[pair].append((pattern, sampled, row))
+                except:
+                    pair_index[pair] = [(pattern, sampled, row)]
+                row += 1
+            self.inc_rows = row
+
+        # Ricalcolo della relazione dei soli pattern coinvolti, direttamente sull'indice hash
+        # A parità di conteggio vince la relazione vista per prima e 'unknown' perde sempre,
+        # come nell'addestramento classico (le labeled sono contate prima delle unlabeled)
+        # così il modello non dipende da come il corpus è stato suddiviso tra gli update
+        mt_map = self.get_mt_map() if self.model_state == 'READY' else dict()
+        for pattern in affected:
+            counts = pattern2relc[pattern]
+            rel = min(counts, key=lambda r: (-counts[r][0], r == 'unknown', counts[r][1]))
+            if rel != 'unknown':
+                mt_map[pattern] = (rel, counts[rel][0])
+            else:
+                mt_map.pop(pattern, None)
+
+        # Model triples ordinate per occorrenza decrescente (costo nel modello, non nel corpus)
+        # a parità nell'ordine della prima riga labeled del pattern, come l'addestramento
+        # classico: ordine e indice non dipendono dall'hash né da come il corpus è suddiviso
+        if affected or self.model_state != 'READY':
+            first = {pattern: _first_labeled(pattern2relc[pattern]) for pattern in mt_map}
+            self.model_triples = [(phr, t1, t2, rel, c) for (phr, t1, t2), (rel, c) in mt_map.items()]
+            self.model_triples.sort(key=lambda t: (-t[4], first[t[:3]]))
+            mt_map = {(phr, t1, t2): (rel, c) for phr, t1, t2, rel, c in self.model_triples}
+            self.column_index = None
+            self.lsh_index = None
+
+            # Conteggi completi aggiornati (rederive non riparte da un modello precedente):
+            # relazioni nell'ordine dei pareggi dell'update, pattern per prima riga labeled
+            if self.keep_counts:
+                ordered = dict()
+                for pattern in sorted(pattern2relc, key=lambda p: _first_labeled(pattern2relc[p])):
+                    counts = pattern2relc[pattern]
+                    ordered[pattern] = {rel: counts[rel][0] for rel in sorted(counts, key=lambda r: (r == 'unknown', counts[r][1]))}
+                self.pattern_counts = _lazy_import('pattern_counts').PatternCounts.from_dict(ordered)
+        self.mt_index = mt_map
+
+        # Modello pronto per estrarre fatti
+        self.model_state = 'READY'
+
+
+    # Ricava di nuovo le model triples dai conteggi completi (keep_counts=True) con soglie diverse
+    # di supporto (min_count) e confidenza (min_confidence: frazione delle occorrenze del pattern
+    # con la relazione scelta) senza riaddestrare il modello
+    def rederive(self, min_count=1, min_confidence=0.0):
+
+        assert self.pattern_counts is not None, 'Pattern counts not available, please train with keep_counts=True.'
+        self.model_triples = self.pattern_counts.model_triples(min_count, min_confidence)
+        self.invalidate_index()
+        self.model_state = 'READY'
+
+
     # Costruisce un indice hash su model triples
     def build_mt_map(self):
         
@@ -169,15 +739,72 @@ class SELector:
             mt_map[(phr, t1, t2)] = (r, c)
         
         return mt_map
+
+
+    # Restituisce l'indice hash sui pattern, costruito alla prima richiesta e poi riusato
+    # finché il modello non cambia (train, set_model_triples e load lo invalidano)
+    def get_mt_map(self):
+
+        if self.mt_index is None:
+            # Controllo stato del modello (una volta per indice, non per ogni predizione)
+            assert self.model_state == 'READY', 'Model not ready, please train the model.'
+            self.mt_index = self.build_mt_map()
+        return self.mt_index
+
+
+    # Invalida gli indici costruiti sulle model triples (il modello è cambiato)
+    def invalidate_index(self):
+
+        self.mt_index = None
+        self.column_index = None
+        self.lsh_index = None
+
+
+    # Restituisce l'indice MinHash LSH dei pattern (None se il fallback non è attivo),
+    # costruito una sola volta dopo train o caricamento (o caricato da save_model)
+    def get_lsh_index(self):
+
+        if self.lsh_threshold is None or self.encoded:
+            return None
+        if self.lsh_index is None:
+            assert self.model_state == 'READY', 'Model not ready, please train the model.'
+            self.lsh_index = _lazy_import('lsh').LSHIndex(self.model_triples, self.lsh_threshold)
+        return self.lsh_index
+
+
+    # Fallback per i fatti rimasti 'unknown': relazione del pattern noto con gli stessi tipi e
+    # la phrase più simile (MinHash LSH), una sola interrogazione batch dell'indice
+    def predict_similar(self, text_triples, facts, lsh_index):
+
+        positions, patterns = list(), list()
+        for i, fact in enumerate(facts):
+            if fact[1] != 'unknown':
+                continue
+            phr, _, t1, _, t2 = text_triples[i]
+            # Stessa riassegnazione tipi di _predict
+            if self.no_types:
+                t1, t2 = '', ''
+            if self.type_remapping:
+                try:
+                    t1 = self.type_remapping[t1]
+                    t2 = self.type_remapping[t2]
+                except:
+                    pass
+            positions.append(i)
+            patterns.append((phr, t1, t2))
+
+        for i, match in zip(positions, lsh_index.query_many(patterns)):
+            if match is not None:
+                e1, _, e2 = facts[i]
+                facts[i] = (e1, match[3], e2)
+
+        return facts
   
 
     # Metodo interno per l'estrazione di una relazione da testo
     def _predict(self, text_triple, mt_map):
 
-        # Controllo stato del modello
-        assert self.model_state == 'READY', 'Model not ready, please train the model.'
-
-        # Spacchetta tripla
+        # Spacchetta tripla (lo stato del modello è già verificato da get_mt_map)
         phr, e1, t1, e2, t2 = text_triple
         
         # Controllo se modalità senza tipi è attiva
@@ -203,21 +830,77 @@ class SELector:
 
     # Estrazione di fatti da text_triples, keep_unknown = True 
     # genererà anche fatti con relazione 'unknown'
-    def harvest(self, input_text_triples, keep_unknown=False):
+    # chunk_size (o un input che sia un iterabile generico) attiva la lettura a blocchi
+    # workers > 1 distribuisce l'estrazione su un pool di processi
+    def harvest(self, input_text_triples, keep_unknown=False, chunk_size=None, workers=None):
+
+        # Streaming: l'input viene consumato a blocchi, si accumulano solo i fatti estratti
+        # (in modalità codificata l'estrazione procede sempre per blocchi vettorizzati)
+        if self.encoded or (workers and workers > 1) or is_streaming(input_text_triples, chunk_size):
+            with self.recorder.stage('harvest') as stage:
+                facts = list(self.iter_harvest(input_text_triples, keep_unknown, chunk_size, workers))
+                stage.set(rows_out=len(facts))
+            return facts
 
         # Se passi un path carica da tsv altrimenti usa il riferimento
         if type(input_text_triples) is str:
             text_triples = list()
             print('Caricamento text triples...', end='', flush=True)
-            self.load_tsv(input_text_triples, text_triples)
+            with self.recorder.stage('load_text') as stage:
+                self.load_tsv(input_text_triples, text_triples)
+                stage.set(rows_out=len(text_triples))
             print('Fatto.', flush=True)
         else:
             text_triples = input_text_triples
 
         # Iterazione su ogni tripla estratta dal testo
-        mt_map = self.build_mt_map() # model triples map (indice hash su pattern)
+        with self.recorder.stage('harvest', rows_in=len(text_triples)) as stage:
+            facts = self.harvest_chunk(text_triples, keep_unknown)
+            stage.set(rows_out=len(facts))
+        return facts
+
+
+    # Estrazione di fatti in streaming (generatore), l'input (path o iterabile)
+    # viene letto a blocchi di chunk_size text triples, con workers > 1 i blocchi
+    # vengono estratti in parallelo da un pool di processi (risultati in ordine)
+    def iter_harvest(self, input_text_triples, keep_unknown=False, chunk_size=None, workers=None):
+
+        assert self.model_state == 'READY', 'Model not ready, please train the model.'
+        chunks = read_chunks(input_text_triples, chunk_size)
+
+        if workers and workers > 1:
+            parallel = _lazy_import('parallel')
+            # Un tsv viene partizionato e letto direttamente dai processi figli
+            if type(input_text_triples) is str:
+                yield from parallel.parallel_harvest_file(self, input_text_triples, keep_unknown, workers)
+            else:
+                yield from parallel.parallel_harvest(self, chunks, keep_unknown, workers)
+            return
+
+        for chunk in chunks:
+            yield from self.harvest_chunk(chunk, keep_unknown)
+
+
+    # Estrazione da un blocco di text triples già in memoria (ed eventualmente normalizzate)
+    def harvest_chunk(self, chunk, keep_unknown=False):
+
+        # Modalità codificata: match vettorizzato su interi, decodifica solo in output
+        if self.encoded:
+            enc = _lazy_import('encoding')
+            return enc.harvest_rows(chunk, self.pattern_index, self.vocabs, self.type_remap_ids, self.no_types, keep_unknown)
+
+        mt_map = self.get_mt_map() # model triples map (indice hash su pattern)
+
+        # Fallback sui pattern simili per le phrases senza corrispondenza esatta
+        lsh_index = self.get_lsh_index()
+        if lsh_index is not None:
+            facts = self.predict_similar(chunk, [self._predict(triple, mt_map) for triple in chunk], lsh_index)
+            if keep_unknown:
+                return facts
+            return [fact for fact in facts if fact[1] != 'unknown']
+
         result = list()
-        for triple in text_triples:
+        for triple in chunk:
             fact = self._predict(triple, mt_map)
             if fact[1] != 'unknown' or keep_unknown:
                 result.append(fact)
@@ -225,10 +908,74 @@ class SELector:
         return result
 
 
+    # Estrazione colonnare: join vettorizzato (pandas) tra le text triples e le model triples
+    # su (phr, t1, t2), stessi fatti di harvest senza chiamate a _predict per riga
+    # L'input può essere un path, un DataFrame o una lista, chunk_size legge il tsv a blocchi
+    # as_frame=True restituisce un DataFrame (e1, rel, e2) invece della lista di tuple
+    def harvest_columnar(self, input_text_triples, keep_unknown=False, chunk_size=None, as_frame=False):
+
+        assert self.model_state == 'READY', 'Model not ready, please train the model.'
+        columnar = _lazy_import('columnar')
+        if self.column_index is None:
+            self.column_index = columnar.build_column_index(self.model_triples)
+
+        result = list()
+        frames = list()
+        for frame in columnar.read_frames(input_text_triples, chunk_size):
+            facts = columnar.harvest_frame(frame, self.column_index, self.type_remapping, self.no_types, keep_unknown, as_frame,
+                                           self.get_lsh_index())
+            if as_frame:
+                frames.append(facts)
+            else:
+                result += facts
+
+        if as_frame:
+            return columnar.concat_frames(frames)
+        return result
+
+
     # Metodo esposto per l'estrazione di singole relazioni
     def predict(self, text_triple):
-        output = self.harvest([text_triple], keep_unknown=True)
-        return output[0]
+        return self.predict_one(text_triple)
+
+
+    # Predizione a bassa latenza di una singola tripla: un solo accesso all'indice
+    # hash già costruito, senza passare da harvest
+    def predict_one(self, text_triple):
+
+        mt_map = self.mt_index
+        if mt_map is None:
+            mt_map = self.get_mt_map()
+
+        fact = self._predict(text_triple, mt_map)
+        if fact[1] == 'unknown' and self.lsh_threshold is not None:
+            lsh_index = self.get_lsh_index()
+            if lsh_index is not None:
+                fact = self.predict_similar([text_triple], [fact], lsh_index)[0]
+
+        return fact
+
+
+    # Predizione di una lista di triple sull'indice già costruito, restituisce
+    # un fatto per ogni tripla (anche con relazione 'unknown') nello stesso ordine
+    def predict_many(self, text_triples):
+
+        # Modalità codificata: match vettorizzato su interi
+        if self.encoded:
+            assert self.model_state == 'READY', 'Model not ready, please train the model.'
+            enc = _lazy_import('encoding')
+            return enc.harvest_rows(list(text_triples), self.pattern_index, self.vocabs, self.type_remap_ids, self.no_types, keep_unknown=True)
+
+        mt_map = self.mt_index
+        if mt_map is None:
+            mt_map = self.get_mt_map()
+
+        facts = [self._predict(triple, mt_map) for triple in text_triples]
+        lsh_index = self.get_lsh_index()
+        if lsh_index is not None:
+            facts = self.predict_similar(list(text_triples), facts, lsh_index)
+
+        return facts
 
 
     # Valuta le prestazioni del modello, input_test deve contenere
@@ -236,78 +983,129 @@ class SELector:
     # gt_map è un mapping delle relazioni: {'P26': ['spouse', 'partner'], ...}
     # gt_map viene usato solo se passato per gestire il disallineamento
     def evaluate(self, input_test, gt_map=None):
-        
+
+        # Stessi conteggi di evaluate_report, restituisce le metriche micro
+        report = self.evaluate_report(input_test, gt_map)
+        if not (report.n_extracted and report.n_relevant and report.precision + report.recall):
+            print('\nDivisione per 0, qualcosa non va bene:')
+            print(f'Fatti estratti totali: {report.n_extracted}')
+            print(f'Fatti estratti corretti: {report.n_correct}')
+            print(f'Fatti rilevanti totali: {report.n_relevant}')
+
+        return report.micro()
+
+
+    # Valutazione vettorizzata (numpy): precision, recall ed F1 micro e macro, conteggi
+    # per relazione e matrice di confusione (evaluation.Evaluation)
+    def evaluate_report(self, input_test, gt_map=None):
+
+        return self.evaluate_many(input_test, {None: gt_map})[None]
+
+
+    # Valuta più mapping della ground truth {nome: gt_map} su un'unica estrazione
+    # e.g. {'perfect': perfect_alignment, 'pid2dbrel': pid2dbrel} (gt_map None: nessun mapping)
+    def evaluate_many(self, input_test, gt_maps):
+
         # Carica da disco se passi un path (text triples)
         if type(input_test) == str:
             test = list()
             print('Caricamento text triples in corso...', end='', flush=True)
-            self.load_tsv(input_test, test)
+            with self.recorder.stage('load_text') as stage:
+                self.load_tsv(input_test, test)
+                stage.set(rows_out=len(test))
             print('Fatto.', flush=True)
         else:
             test = input_test
 
-        # Se si sta specificando un mapping per relazioni di interesse
-        if gt_map:
-            target_relations = [r for rels in gt_map.values() for r in rels]
-
         # Effettua le estrazioni con il modello escludendo la ground truth
         harvested = self.harvest([record[:-1] for record in test], keep_unknown=True)
-        
-        # Valutazione estrazioni       
-        extr_card, true_card, relevant_card = 0, 0, 0
-        for i, record in enumerate(test):
+        gold = [record[-1] for record in test]
+        predicted = [relation for _, relation, _ in harvested]
 
-            # Se si usa un mapping delle relazioni
-            if gt_map:
-                # Cerca corrispondenze con la ground truth
-                try:
-                    true_relations = gt_map[record[-1]]
-                # Se la relazione non ha corrispondenze
-                except:
-                    true_relations = ['unknown']
-            # Se non si usa un mapping la relazione associata è 
-            # solo quella specificata nel file di test
-            else:
-                true_relations = [record[-1]]
-            # Relazione estratta dal modello
-            _, relation, _ = harvested[i]
-
-            # Se la relazione estratta non è nel mapping          
-            if gt_map and relation not in target_relations:
-                relation = 'unknown'
-
-            # Se la relazione estratta non è unknown
-            if relation != 'unknown':
-                # Incrementa il conteggio delle relazioni estratte
-                extr_card += 1
-                # Se la relazione estratta è anche corretta
-                if relation in true_relations:
-                    # Incrementa il conteggio delle estrazioni corrette
-                    true_card += 1
-            # Conta le relazioni rilevanti nella ground truth
-            if true_relations != ['unknown']:
-                relevant_card += 1
-
-        # Calcolo precision, recall ed fScore
-        precision, recall, fscore = 0, 0, 0        
-        try:
-            precision = true_card / extr_card
-            recall = true_card / relevant_card
-            fscore =(precision*recall/(precision+recall))*2
-        except:
-            print('\nDivisione per 0, qualcosa non va bene:')
-            print(f'Fatti estratti totali: {extr_card}')
-            print(f'Fatti estratti corretti: {true_card}')
-            print(f'Fatti rilevanti totali: {relevant_card}')
+        return _lazy_import('evaluation').evaluate_many(gold, predicted, gt_maps)
 
-        return precision, recall, fscore
 
+    # Iperparametri del modello, gli stessi argomenti del costruttore
+    def get_params(self):
 
-    # Salva il modello (model_triples)
+        return {'rseed': self.rseed,
+                'unlabeled_sub': self.unlabeled_sub,
+                'no_types': self.no_types,
+                'type_remapping': self.type_remapping,
+                'enable_LP': self.enable_LP,
+                'encoded': self.encoded,
+                'lsh_threshold': self.lsh_threshold,
+                'keep_counts': self.keep_counts}
+
+
+    # Crea un modello con gli iperparametri salvati (ignora quelli non supportati dalla classe)
+    @classmethod
+    def from_params(cls, params):
+
+        accepted = inspect.signature(cls).parameters
+        return cls(**{k: v for k, v in params.items() if k in accepted})
+
+
+    # Imposta le model triples [(phr, t1, t2, rel, count), ...] e rende il modello pronto
+    def set_model_triples(self, model_triples):
+
+        if self.encoded:
+            enc = _lazy_import('encoding')
+            self.vocabs = enc.Vocabularies()
+            self.model_triples = enc.EncodedTable.from_chunks(enc.MODEL_FIELDS, self.vocabs, [model_triples])
+            if self.type_remapping:
+                self.type_remap_ids = enc.encode_type_remapping(self.type_remapping, self.vocabs.types)
+            self.pattern_index = enc.PatternIndex(self.model_triples)
+        else:
+            self.model_triples = list(model_triples)
+        self.invalidate_index()
+        self.clear_incremental()
+        self.pattern_counts = None
+        self.model_state = 'READY'
+
+
+    # Salva il modello (model_triples, iperparametri e riassegnamento tipi) in un tsv leggibile
     def save_to_tsv(self, save_path):
 
-        # TODO: Da implementare salvataggio su file tsv di model_triples
-        print('Not implemented yet.')
+        assert self.model_state == 'READY', 'Model not ready, please train the model.'
+        _lazy_import('model_store').write_tsv(save_path, self.get_params(), self.model_triples)
+
+
+    # Carica un modello salvato con save_to_tsv
+    @classmethod
+    def load_from_tsv(cls, file_path):
+
+        params, model_triples = _lazy_import('model_store').read_tsv(file_path)
+        slc = cls.from_params(params)
+        slc.set_model_triples(model_triples)
+        return slc
+
+
+    # Salva il modello in formato binario (cartella con array e indice hash in memory-map)
+    def save_model(self, dir_path):
+
+        assert self.model_state == 'READY', 'Model not ready, please train the model.'
+        _lazy_import('model_store').write_mapped(dir_path, self.get_params(), self.model_triples)
+        # L'indice dei pattern simili viene salvato insieme al modello
+        lsh_index = self.get_lsh_index()
+        if lsh_index is not None:
+            lsh_index.save(join(dir_path, LSH_FILE))
+
+
+    # Carica un modello binario salvato con save_model: i file vengono solo aperti in
+    # memory-map, l'indice hash è già pronto e non serve ricostruire build_mt_map()
+    @classmethod
+    def load_model(cls, dir_path):
+
+        mapped = _lazy_import('model_store').MappedModel(dir_path)
+        params = dict(mapped.params, encoded=False) # Il formato binario è già codificato
+        slc = cls.from_params(params)
+        slc.model_triples = mapped
+        slc.mt_index = mapped
+        slc.model_state = 'READY'
+        if slc.lsh_threshold is not None and exists(join(dir_path, LSH_FILE)):
+            slc.lsh_index = _lazy_import('lsh').LSHIndex.load(join(dir_path, LSH_FILE))
+        return slc
 
 
     # Utility, mostra il contenuto di una struttura dati
@@ -337,7 +1135,7 @@ if __name__ == '__main__':
 
     # Inizializza e addestra modello
     sel = SELector(rseed=42, unlabeled_sub=0.8)
-    sel.train(toy_tt_path, toy_kg_path)
+    sel.train(toy_tt_path, toy_kg_path, keep_tables=True)
 
     # Mostra strutture dati dopo l'addestramento
     sel.show_list('text_triples')
@@ -361,3 +1159,20 @@ if __name__ == '__main__':
     print(f'Precision: {precision}')
     print(f'Recall: {recall}')
     print(f'fScore: {fscore}')
+
+    # Addestramento incrementale: update successivi sul corpus suddiviso devono produrre le
+    # stesse model triples, nello stesso ordine, di un unico addestramento incrementale
+    # (anche tra esecuzioni con PYTHONHASHSEED diversi) e rederive deve partire dai conteggi aggiornati
+    text_triples, kg_facts = list(sel.text_triples), list(sel.knowledge_graph)
+    half = len(text_triples) // 2
+    full = SELector(rseed=42, unlabeled_sub=0.8, keep_counts=True)
+    full.train(text_triples, kg_facts, incremental=True)
+    split = SELector(rseed=42, unlabeled_sub=0.8, keep_counts=True)
+    split.update(None, kg_facts)
+    split.update(text_triples[:half])
+    split.update(text_triples[half:])
+    assert split.model_triples == full.model_triples, 'Incremental updates differ from full training.'
+    assert list(split.get_mt_map()) == [t[:3] for t in split.model_triples]
+    split.rederive()
+    assert split.model_triples == full.model_triples, 'rederive ignores incremental updates.'
+    print('\nAddestramento incrementale: model triples identiche e nello stesso ordine.')
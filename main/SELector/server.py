@@ -0,0 +1,243 @@
+# Server di estrazione asincrono (asyncio) per SELector con micro-batching
+# Il modello viene caricato una sola volta, le richieste concorrenti vengono raccolte in
+# micro-batch (al più max_batch_size triple, attesa massima max_wait_ms dalla prima) e
+# risolte con un'unica chiamata a predict_many. HTTP/1.1 minimale con keep-alive su TCP
+# o socket Unix, solo libreria standard:
+# POST /predict  {"triples": [[phr, e1, t1, e2, t2], ...]} -> {"facts": [[e1, rel, e2], ...]}
+# GET  /metrics  istogrammi di latenza (ms) e dimensione dei batch
+# GET  /health
+# Uso: python server.py <modello> [--tsv] [--port 8080 | --unix /tmp/selector.sock]
+import argparse
+import asyncio
+import bisect
+import json
+import time
+
+try:
+    from .selector import SELector
+except ImportError:
+    from selector import SELector
+
+
+# Limiti dei bucket degli istogrammi
+LATENCY_BUCKETS_MS = [0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000]
+BATCH_BUCKETS = [1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024]
+
+
+# Istogramma a bucket fissi (conteggi cumulabili, percentili stimati dal bucket)
+class Histogram:
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.total = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.total += 1
+        self.sum += value
+
+    # Limite superiore del bucket che contiene il percentile q (0-100)
+    def percentile(self, q):
+        if not self.total:
+            return 0.0
+        rank, seen = q / 100 * self.total, 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return self.bounds[i] if i < len(self.bounds) else float('inf')
+        return float('inf')
+
+    def to_dict(self):
+        return {'buckets': dict(zip([str(b) for b in self.bounds] + ['+Inf'], self.counts)),
+                'count': self.total,
+                'mean': self.sum / self.total if self.total else 0.0,
+                'p50': self.percentile(50), 'p99': self.percentile(99)}
+
+
+# Raccoglie le richieste concorrenti in micro-batch risolti con una sola predict_many
+class MicroBatcher:
+
+    def __init__(self, model, max_batch_size=64, max_wait_ms=2.0):
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.queue = asyncio.Queue()
+        self.latency = Histogram(LATENCY_BUCKETS_MS)
+        self.batch_size = Histogram(BATCH_BUCKETS)
+        self.task = None
+
+    def start(self):
+        self.task = asyncio.ensure_future(self.run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+
+    # Predice le triple di una richiesta, attende il batch in cui viene inserita
+    async def predict(self, triples):
+        start = time.perf_counter()
+        future = asyncio.get_event_loop().create_future()
+        await self.queue.put((triples, future))
+        facts = await future
+        self.latency.observe((time.perf_counter() - start) * 1000)
+        return facts
+
+    async def run(self):
+        loop = asyncio.get_event_loop()
+        while True:
+            # Il batch parte dalla prima richiesta in coda e attende al più max_wait
+            batch = [await self.queue.get()]
+            size = len(batch[0][0])
+            deadline = loop.time() + self.max_wait
+            while size < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                batch.append(item)
+                size += len(item[0])
+
+            # Un'unica estrazione per tutte le triple del batch, in un thread: l'event loop
+            # continua a servire le altre connessioni durante la predizione
+            triples = [tuple(t) for request, _ in batch for t in request]
+            try:
+                facts = await loop.run_in_executor(None, self.model.predict_many, triples)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            self.batch_size.observe(len(triples))
+            offset = 0
+            for request, future in batch:
+                if not future.done():
+                    future.set_result(facts[offset:offset + len(request)])
+                offset += len(request)
+
+    def metrics(self):
+        return {'latency_ms': self.latency.to_dict(), 'batch_size': self.batch_size.to_dict()}
+
+
+# Richiesta valida: lista di triple, ognuna lista di 5 stringhe
+def valid_triples(triples):
+
+    return isinstance(triples, list) and all(
+        isinstance(t, list) and len(t) == 5 and all(isinstance(field, str) for field in t) for t in triples)
+
+
+# Server HTTP/1.1 minimale con connessioni keep-alive
+class ExtractionServer:
+
+    def __init__(self, model, max_batch_size=64, max_wait_ms=2.0):
+        self.batcher = MicroBatcher(model, max_batch_size, max_wait_ms)
+        self.server = None
+
+    async def start(self, host='127.0.0.1', port=8080, unix_path=None):
+        self.batcher.start()
+        if unix_path:
+            self.server = await asyncio.start_unix_server(self.handle, path=unix_path)
+        else:
+            self.server = await asyncio.start_server(self.handle, host, port)
+        return self.server
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        await self.batcher.stop()
+
+    # Porta effettiva (utile con port=0)
+    def port(self):
+        return self.server.sockets[0].getsockname()[1]
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode('latin1').split(' ', 2)
+                headers = dict()
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get('content-length', 0)))
+
+                status, payload = await self.route(method, path, body)
+                data = json.dumps(payload).encode('utf8')
+                writer.write(f'HTTP/1.1 {status}\r\nContent-Type: application/json\r\n'
+                             f'Content-Length: {len(data)}\r\n\r\n'.encode('latin1') + data)
+                await writer.drain()
+                if headers.get('connection', '').lower() == 'close':
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def route(self, method, path, body):
+        if method == 'POST' and path == '/predict':
+            try:
+                request = json.loads(body)
+                triples = request['triples'] if isinstance(request, dict) else request
+            except Exception:
+                triples = None
+            if not valid_triples(triples):
+                return '400 Bad Request', {'error': 'expected {"triples": [[phr, e1, t1, e2, t2], ...]} with string fields'}
+            facts = await self.batcher.predict(triples)
+            return '200 OK', {'facts': [list(f) for f in facts]}
+        if method == 'GET' and path == '/metrics':
+            return '200 OK', self.batcher.metrics()
+        if method == 'GET' and path == '/health':
+            return '200 OK', {'status': 'ok'}
+        return '404 Not Found', {'error': 'not found'}
+
+
+# Carica un modello salvato (cartella binaria di save_model o tsv di save_to_tsv)
+def load(model_path, tsv=False):
+
+    model = SELector.load_from_tsv(model_path) if tsv else SELector.load_model(model_path)
+    model.get_mt_map()
+    model.get_lsh_index()
+    return model
+
+
+async def serve(model, host='127.0.0.1', port=8080, unix_path=None, max_batch_size=64, max_wait_ms=2.0):
+
+    server = ExtractionServer(model, max_batch_size, max_wait_ms)
+    await server.start(host, port, unix_path)
+    print(f'SELector server in ascolto su {unix_path or f"{host}:{server.port()}"}', flush=True)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='SELector micro-batching extraction server')
+    parser.add_argument('model', help='cartella di save_model (o tsv di save_to_tsv con --tsv)')
+    parser.add_argument('--tsv', action='store_true')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--unix', default=None, help='path del socket Unix (al posto di host e porta)')
+    parser.add_argument('--max-batch-size', type=int, default=64)
+    parser.add_argument('--max-wait-ms', type=float, default=2.0)
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(serve(load(args.model, args.tsv), args.host, args.port, args.unix,
+                          args.max_batch_size, args.max_wait_ms))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,45 @@
+# Utility per l'ingestione a blocchi (streaming) dei dati di SELector
+# I dati vengono letti in blocchi di dimensione limitata, in questo modo
+# la memoria occupata dipende dalla dimensione del blocco e non dal corpus
+from itertools import islice
+import csv
+
+
+# Dimensione di default di un blocco (numero di record)
+DEFAULT_CHUNK_SIZE = 100000
+
+
+# Suddivide un iterabile qualsiasi in liste di al più chunk_size elementi
+def iter_chunks(iterable, chunk_size=DEFAULT_CHUNK_SIZE):
+
+    it = iter(iterable)
+    while True:
+        chunk = list(islice(it, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+# Legge un tsv a blocchi di al più chunk_size tuple
+def iter_tsv_chunks(file_path, chunk_size=DEFAULT_CHUNK_SIZE):
+
+    with open(file_path, 'r', encoding='utf8') as tsv_file:
+        rd = csv.reader(tsv_file, delimiter='\t')
+        yield from iter_chunks((tuple(line) for line in rd), chunk_size)
+
+
+# Restituisce un generatore di blocchi a partire da un path (tsv) o da un iterabile
+def read_chunks(source, chunk_size=None):
+
+    if not chunk_size:
+        chunk_size = DEFAULT_CHUNK_SIZE
+    if type(source) is str:
+        return iter_tsv_chunks(source, chunk_size)
+    return iter_chunks(source, chunk_size)
+
+
+# Stabilisce se un input va consumato in streaming: sempre se viene
+# specificato chunk_size, altrimenti solo se non è un path o una lista in memoria
+def is_streaming(source, chunk_size=None):
+
+    return bool(chunk_size) or not isinstance(source, (str, list, tuple))
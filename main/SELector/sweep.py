@@ -0,0 +1,230 @@
+# Ricerca degli iperparametri di SELector (sweep)
+# Gli stadi costosi e comuni a tutte le configurazioni vengono eseguiti una sola volta e
+# tenuti in cache: caricamento di text triples, kg e test set, join con il kg (relazioni
+# di ogni text triple) e normalizzazione delle phrases. Ogni configurazione ricava le
+# proprie model triples dalla cache (riassegnazione tipi, sottocampionamento e conteggio
+# pattern come in SELector.train) e viene valutata sul test set, le configurazioni girano
+# in parallelo su un pool di processi che condividono la cache
+from itertools import product
+import multiprocessing as mp
+import random
+
+try:
+    from .streaming import read_chunks
+    from .selector import SELector
+    from . import evaluation
+except ImportError:
+    from streaming import read_chunks
+    from selector import SELector
+    import evaluation
+
+
+# Cache condivisa dai processi del pool
+_worker_cache = None
+
+
+# Configurazioni come prodotto cartesiano dei valori dei parametri
+# e.g. grid(unlabeled_sub=[0.3, 0.5], no_types=[False, True])
+def grid(**params):
+
+    names = list(params)
+    return [dict(zip(names, values)) for values in product(*params.values())]
+
+
+def _text_preprocessing():
+    try:
+        from . import text_preprocessing
+    except ImportError:
+        import text_preprocessing
+    return text_preprocessing
+
+
+# Nome del backend di normalizzazione di un valore di text_norm (True: backend di default)
+def norm_backend(text_norm):
+
+    return text_norm if isinstance(text_norm, str) else _text_preprocessing().DEFAULT_BACKEND
+
+
+# Normalizza le phrases distinte con il backend indicato (o con normalizer, funzione su una
+# tabella [(phr,), ...] come text_triples_norm), restituisce {phrase: phrase normalizzata}
+def normalize_phrases(phrases, normalizer=None, backend=None):
+
+    if normalizer is None:
+        text_triples_norm = _text_preprocessing().text_triples_norm
+        normalizer = lambda table: text_triples_norm(table, backend=backend)
+    unique = list(dict.fromkeys(phrases))
+    norm = [record[0] for record in normalizer([(phr,) for phr in unique])]
+
+    return dict(zip(unique, norm))
+
+
+# Stadi comuni a tutte le configurazioni
+# text_norm calcola anche le phrases normalizzate (per le configurazioni che le usano), una
+# volta per backend: True (backend di default), nome di un backend (e.g. 'regex') o lista
+# di valori; normalizer (funzione come text_triples_norm) sostituisce i backend
+# cls è la classe del modello (la sua build_kg_dict stabilisce come trattare i fatti duplicati)
+class SweepCache:
+
+    def __init__(self, input_text_triples, input_knowledge_graph, input_test, text_norm=False,
+                 cls=SELector, normalizer=None, chunk_size=None):
+        self.cls = cls
+
+        # Text triples e relazioni del kg associate ad ogni coppia (e1, e2), None se unlabeled
+        print('Caricamento text triples e knowledge graph, join con il kg...', end='', flush=True)
+        kg_dict = cls().build_kg_dict(read_chunks(input_knowledge_graph, chunk_size))
+        self.text_triples = [tuple(record) for chunk in read_chunks(input_text_triples, chunk_size) for record in chunk]
+        self.row_rels = [kg_dict.get((e1,e2)) for _, e1, _, e2, _ in self.text_triples]
+        self.num_unlabeled = sum(rels is None for rels in self.row_rels)
+        del(kg_dict)
+        print('Fatto.', flush=True)
+
+        # Test set: text triples e relazione della ground truth
+        test = [tuple(record) for chunk in read_chunks(input_test, chunk_size) for record in chunk]
+        self.test_triples = [record[:-1] for record in test]
+        self.gold = [record[-1] for record in test]
+
+        # Phrases normalizzate {backend: (phrases text triples, phrases test set)}
+        # (una sola volta per phrase distinta e per backend)
+        self.norm_phrases = dict()
+        for value in (text_norm if isinstance(text_norm, (list, tuple)) else [text_norm]):
+            if not value:
+                continue
+            backend = norm_backend(value)
+            if backend in self.norm_phrases:
+                continue
+            print(f'Normalizzazione phrases ({backend})...', end='', flush=True)
+            norm = normalize_phrases([t[0] for t in self.text_triples] + [t[0] for t in self.test_triples], normalizer, backend)
+            self.norm_phrases[backend] = ([norm[t[0]] for t in self.text_triples], [norm[t[0]] for t in self.test_triples])
+            print('Fatto.', flush=True)
+
+    # Phrases normalizzate con il backend di text_norm
+    def normalized(self, text_norm):
+        backend = norm_backend(text_norm)
+        assert backend in self.norm_phrases, f'Phrases not normalized with {backend}, build the cache with text_norm={backend!r}.'
+        return self.norm_phrases[backend]
+
+    # Phrases delle text triples (normalizzate o originali)
+    def text_phrases(self, text_norm=False):
+        if text_norm:
+            return self.normalized(text_norm)[0]
+        return [t[0] for t in self.text_triples]
+
+    # Text triples del test set (con phrases normalizzate o originali)
+    def test_set(self, text_norm=False):
+        if text_norm:
+            return [(phr,) + t[1:] for phr, t in zip(self.normalized(text_norm)[1], self.test_triples)]
+        return self.test_triples
+
+
+# Ricava dalla cache il modello di una configurazione (parametri del costruttore di SELector)
+# Stesse model triples di SELector.train: stessi pattern, stessi indici di random.sample
+# Le phrases sono già normalizzate nella cache, il modello restituito non normalizza
+def derive_model(cache, params):
+
+    text_norm = params.get('text_norm', False)
+    assert not params.get('enable_LP'), 'Sweep does not support link prediction.'
+    model = cache.cls.from_params(dict(params, text_norm=False, encoded=False))
+    type_remapping, no_types = model.type_remapping, model.no_types
+
+    # Conteggio delle labeled, le unlabeled servono solo se vengono campionate
+    pattern2relc = dict()
+    unlabeled = list()
+    keep_unlabeled = model.unlabeled_sub > 0
+    for phr, (_, _, t1, _, t2), rels in zip(cache.text_phrases(text_norm), cache.text_triples, cache.row_rels):
+        # Riassegnazione tipi
+        if type_remapping:
+            try:
+                t1 = type_remapping[t1]
+                t2 = type_remapping[t2]
+            except:
+                pass
+        if no_types:
+            t1, t2 = '', ''
+        pattern = (phr, t1, t2)
+        if rels is None:
+            if keep_unlabeled:
+                unlabeled.append(pattern)
+            continue
+        counts = pattern2relc.setdefault(pattern, dict())
+        for rel in rels:
+            try:
+                counts[rel] += 1
+            except:
+                counts[rel] = 1
+
+    # Sottocampionamento: 'unknown' serve solo ai pattern che hanno anche labeled
+    num_sample = int(cache.num_unlabeled * model.unlabeled_sub)
+    random.seed(model.rseed) # Deterministico, usa rseed=None per seed casuali
+    for i in random.sample(range(cache.num_unlabeled), k=num_sample):
+        counts = pattern2relc.get(unlabeled[i])
+        if counts is not None:
+            counts['unknown'] = counts.get('unknown', 0) + 1
+
+    model.build_model_triples(pattern2relc)
+    model.model_state = 'READY'
+
+    return model
+
+
+# Addestra e valuta una configurazione, restituisce una riga della tabella dei risultati
+def run_config(cache, params, gt_map=None):
+
+    model = derive_model(cache, params)
+    text_norm = params.get('text_norm', False)
+    predicted = [rel for _, rel, _ in model.harvest_chunk(cache.test_set(text_norm), keep_unknown=True)]
+    report = evaluation.evaluate(cache.gold, predicted, gt_map)
+
+    # Il riassegnamento dei tipi è un dizionario, in tabella compare solo se è attivo
+    row = dict(params)
+    if 'type_remapping' in row:
+        row['type_remapping'] = bool(row['type_remapping'])
+    row.update({'model_triples': len(model.model_triples),
+                'precision': report.precision, 'recall': report.recall, 'fscore': report.fscore,
+                'macro_precision': report.macro_precision, 'macro_recall': report.macro_recall,
+                'macro_fscore': report.macro_fscore})
+    return row
+
+
+# Inizializzazione di un processo del pool (solo se non si può usare fork)
+def _init_worker(cache=None):
+
+    global _worker_cache
+    if cache is not None:
+        _worker_cache = cache
+
+
+def _run_worker(args):
+
+    params, gt_map = args
+    return run_config(_worker_cache, params, gt_map)
+
+
+# Esegue le configurazioni [{parametro: valore}, ...] e restituisce un DataFrame con
+# precision, recall ed F1 (micro e macro) per configurazione, nell'ordine delle configurazioni
+# workers=1 esegue tutto nel processo corrente
+def sweep(cache, configs, gt_map=None, workers=None):
+
+    global _worker_cache
+    import pandas as pd
+
+    if not workers:
+        workers = min(mp.cpu_count(), len(configs))
+    if workers <= 1:
+        rows = [run_config(cache, params, gt_map) for params in configs]
+        return pd.DataFrame(rows)
+
+    # Con fork i processi figli condividono la cache copy-on-write, altrimenti la ricevono all'avvio
+    if 'fork' in mp.get_all_start_methods():
+        ctx = mp.get_context('fork')
+        _worker_cache = cache
+        initargs = ()
+    else:
+        ctx = mp.get_context('spawn')
+        initargs = (cache,)
+    try:
+        with ctx.Pool(workers, initializer=_init_worker, initargs=initargs) as pool:
+            rows = pool.map(_run_worker, [(params, gt_map) for params in configs], chunksize=1)
+    finally:
+        _worker_cache = None
+
+    return pd.DataFrame(rows)
@@ -1,68 +1,327 @@
 from multiprocessing import cpu_count
-from itertools import groupby
-import pandas as pd
+import multiprocessing as mp
+import json
+import os
+from itertools import groupby, islice
 import string
-import spacy
 import time
+import re
 
+try:
+    from .phrase_cache import PhraseCache
+except ImportError:
+    from phrase_cache import PhraseCache
 
-# Spacy permette di escludere parti della pipeline non necessarie per migliorare le prestazioni
-nlp = spacy.load('en_core_web_sm', exclude=['tok2vec', 'tagger', 'parser', 'attribute_ruler', 'lemmatizer'])
+
+# Pipeline spaCy caricata al primo utilizzo (importare il modulo non carica il modello)
+nlp = None
+
+
+def get_nlp():
+
+    global nlp
+    if nlp is None:
+        import spacy
+        # Spacy permette di escludere parti della pipeline non necessarie per migliorare le prestazioni
+        nlp = spacy.load('en_core_web_sm', exclude=['tok2vec', 'tagger', 'parser', 'attribute_ruler', 'lemmatizer'])
+    return nlp
 
 
 # Numero di core disponibili
 CPUs = cpu_count()
 
+# Processi usati di default da nlp.pipe (NormalizerService normalizza con n_process=1,
+# nel processo corrente o in ogni processo del pool persistente)
+N_PROCESS = CPUs
+
+# Testi per batch inviati da nlp.pipe ai processi
+DEFAULT_BATCH_SIZE = 1000
+
+# Righe per blocco della normalizzazione in streaming (iter_text_triples_norm)
+DEFAULT_CHUNK_SIZE = 100000
+
+
+# Cache delle phrases normalizzate condivisa da tutte le chiamate del processo
+# (di default solo in memoria, set_cache(PhraseCache('norm.sqlite')) la rende persistente)
+_cache = PhraseCache()
+
+
+# Imposta la cache delle phrases (None la disabilita)
+def set_cache(cache):
+
+    global _cache
+    _cache = cache
+
+
+def get_cache():
+
+    return _cache
+
+
+# Testo normalizzato di un doc spaCy: tipo di entità al posto dei token riconosciuti,
+# token in minuscolo, solo token alfabetici stampabili
+def doc_norm(doc):
+
+    tokens = [t.ent_type_ if t.ent_type_ else t.text.lower() for t in doc]
+    tokens = [token for token in tokens if token.isprintable() and token.isalpha()]
+    tokens = [g[0] for g in groupby(tokens)] # Collassa ripetizioni e.g. DATE, DATE, DATE -> DATE        
+    return ' '.join(tokens)
+
 
 # Normalizza i testi di un corpus di coppie: [(testo, contesto),...]
 # Possono essere implementate diverse funzioni in futuro per esperimento
-def spacy_text_norm(corpus):
+# Ai processi di nlp.pipe arrivano solo i testi distinti (stringhe, batch_size per batch),
+# i contesti restano nel processo corrente e vengono riassociati tramite l'indice del testo
+# n_process: processi di nlp.pipe (default N_PROCESS)
+def spacy_text_norm(corpus, batch_size=DEFAULT_BATCH_SIZE, n_process=None):
+
+    corpus = corpus if isinstance(corpus, list) else list(corpus)
+    index = dict()
+    for text, _ in corpus:
+        if text not in index:
+            index[text] = len(index)
+
+    norm_texts = [doc_norm(doc) for doc in get_nlp().pipe(list(index), batch_size=batch_size,
+                                                            n_process=n_process or N_PROCESS)]
+
+    return [(norm_texts[index[text]], context) for text, context in corpus]
+
+
+# Token della normalizzazione regex: parole, numeri e simboli isolati
+TOKEN_RE = re.compile(r'[^\W\d_]+|\d+(?:[.,:]\d+)*|\S')
+YEAR_RE = re.compile(r'1\d{3}|20\d{2}')
+
+
+# Normalizzazione veloce senza modello: minuscolo, anni -> DATE e numeri -> CARDINAL
+# (le etichette più frequenti del NER di spaCy sui numeri), poi stessi filtri di spacy_text_norm
+def regex_text_norm(corpus, batch_size=None, n_process=None):
 
     converted = []
 
-    for doc, context in nlp.pipe(corpus, as_tuples=True, n_process=CPUs):
-        tokens = [t.ent_type_ if t.ent_type_ else t.text.lower() for t in doc]
-        tokens = [token for token in tokens if token.isprintable() and token.isalpha()]
-        tokens = [g[0] for g in groupby(tokens)] # Collassa ripetizioni e.g. DATE, DATE, DATE -> DATE        
-        norm_phr = ' '.join(tokens)
-        converted.append((norm_phr, context))
+    for text, context in corpus:
+        tokens = list()
+        for token in TOKEN_RE.findall(text):
+            if token[0].isdigit():
+                token = 'DATE' if YEAR_RE.fullmatch(token) else 'CARDINAL'
+            else:
+                token = token.lower()
+            if token.isprintable() and token.isalpha():
+                tokens.append(token)
+        tokens = [g[0] for g in groupby(tokens)] # Collassa ripetizioni e.g. DATE, DATE, DATE -> DATE
+        converted.append((' '.join(tokens), context))
 
     return converted
 
 
+# Backend di normalizzazione {nome: funzione(corpus [(testo, contesto), ...], batch_size[, n_process])}
+BACKENDS = {'spacy': spacy_text_norm, 'regex': regex_text_norm}
+DEFAULT_BACKEND = 'spacy'
+
+
+# Registra un backend di normalizzazione con la stessa interfaccia di spacy_text_norm
+def register_backend(name, normalizer):
+
+    BACKENDS[name] = normalizer
+
+
+def get_backend(name=None):
+
+    try:
+        return BACKENDS[name or DEFAULT_BACKEND]
+    except KeyError:
+        raise ValueError(f'Unknown normalization backend {name}, available: {", ".join(BACKENDS)}')
+
+
+# Normalizza una lista di phrases (distinte), restituisce le phrases normalizzate nello stesso ordine
+# n_process viene passato al backend solo se indicato (backend registrati senza n_process)
+def phrases_norm(phrases, backend=None, batch_size=DEFAULT_BATCH_SIZE, n_process=None):
+
+    options = {'batch_size': batch_size}
+    if n_process is not None:
+        options['n_process'] = n_process
+    return [norm_phr for norm_phr, _ in get_backend(backend)([(phr, None) for phr in phrases], **options)]
+
+
+# Inizializzazione di un processo del pool persistente: il modello viene caricato una sola volta
+def _init_worker(backend):
+
+    if backend == 'spacy':
+        get_nlp()
+
+
+def _worker_norm(args):
+
+    phrases, backend, batch_size = args
+    return phrases_norm(phrases, backend, batch_size, n_process=1)
+
+
+# Servizio di normalizzazione con un pool di processi persistente: i processi caricano il
+# modello una sola volta all'avvio (al primo utilizzo) e vengono riusati da tutte le chiamate
+# fino a close(), nessun costo di avvio dei processi e di caricamento del modello per chiamata
+# processes <= 1 non avvia il pool e normalizza nel processo corrente (nlp.pipe con n_process=1)
+class NormalizerService:
+
+    def __init__(self, backend=None, processes=None, batch_size=DEFAULT_BATCH_SIZE):
+        self.backend = backend or DEFAULT_BACKEND
+        self.processes = CPUs if processes is None else processes
+        self.batch_size = batch_size
+        self.pool = None
+        self.pid = None
+
+    # Il pool appartiene al processo che lo ha creato, non viene copiato né serializzato
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state['pool'] = state['pid'] = None
+        return state
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def start(self):
+        if self.pool is None or self.pid != os.getpid():
+            self.pool = mp.Pool(self.processes, initializer=_init_worker, initargs=(self.backend,))
+            self.pid = os.getpid()
+        return self.pool
+
+    # Normalizza una lista di phrases distinte, risultato nello stesso ordine
+    # (i batch di batch_size phrases vengono distribuiti sui processi del pool)
+    def __call__(self, phrases):
+        if self.processes <= 1:
+            return phrases_norm(phrases, self.backend, self.batch_size, n_process=1)
+        batches = [(phrases[i:i + self.batch_size], self.backend, self.batch_size) for i in range(0, len(phrases), self.batch_size)]
+        return [norm_phr for batch in self.start().imap(_worker_norm, batches) for norm_phr in batch]
+
+    # Stessa interfaccia di text_triples_norm / iter_text_triples_norm con il pool del servizio
+    def text_triples_norm(self, table, cache=None, chunk_size=None):
+        return text_triples_norm(table, cache, self.backend, chunk_size, self.batch_size, service=self)
+
+    def iter_text_triples_norm(self, table, cache=None, chunk_size=DEFAULT_CHUNK_SIZE):
+        return iter_text_triples_norm(table, cache, self.backend, chunk_size, self.batch_size, service=self)
+
+    def close(self):
+        if self.pool is not None and self.pid == os.getpid():
+            self.pool.close()
+            self.pool.join()
+        self.pool = self.pid = None
+
+
+# Normalizzazione in streaming di una tabella (lista o iterabile) nel formato
+# [(phrase, e1, t1, e2, t2, ...), ...]: genera blocchi di al più chunk_size record normalizzati
+# (chunk_size=None un unico blocco). Di ogni blocco vengono normalizzate solo le phrases
+# distinte (con la cache solo quelle mai viste), i record vengono ricostruiti localmente,
+# memoria e traffico verso i processi dipendono dalle phrases distinte del blocco
+# service: NormalizerService già avviato da usare al posto di un nuovo pool per chiamata
+def iter_text_triples_norm(table, cache=None, backend=None, chunk_size=DEFAULT_CHUNK_SIZE, batch_size=DEFAULT_BATCH_SIZE,
+                           service=None):
+
+    if cache is None:
+        cache = _cache
+    if service is not None:
+        backend, normalizer = service.backend, service
+    else:
+        backend = backend or DEFAULT_BACKEND
+        normalizer = lambda phrases: phrases_norm(phrases, backend, batch_size)
+
+    rows = iter(table)
+    while True:
+        chunk = table if chunk_size is None and isinstance(table, list) else list(islice(rows, chunk_size))
+        if not chunk:
+            return
+        phrases = [record[0] for record in chunk]
+        if cache is not None:
+            norm_phrases = cache.normalize(phrases, normalizer, backend)
+        else:
+            unique = list(dict.fromkeys(phrases))
+            norm_map = dict(zip(unique, normalizer(unique)))
+            norm_phrases = [norm_map[phr] for phr in phrases]
+        yield [(norm_phr, *record[1:]) for norm_phr, record in zip(norm_phrases, chunk)]
+        if chunk_size is None:
+            return
+
+
 # Applica la normalizzazione del testo ad una tabella
 # nel formato: [(phrase, e1, t1, e2, t2, ...), ...]
 # la phrase o il testo da normalizzare deve essere nel primo campo di ogni record
-def text_triples_norm(table):
+# Con la cache (cache o quella del modulo) solo le phrases mai viste vengono normalizzate
+# backend: nome del backend registrato (default spaCy), chunk_size e batch_size come iter_text_triples_norm
+def text_triples_norm(table, cache=None, backend=None, chunk_size=None, batch_size=DEFAULT_BATCH_SIZE, service=None):
+
+    return [record for chunk in iter_text_triples_norm(table, cache, backend, chunk_size, batch_size, service) for record in chunk]
+
 
-    # Creazione corpus (phrase, contesto)
-    corpus = [(record[0], record[1:]) for record in table]
+# Stato di avanzamento di preprocess_tsv (blocchi completati, righe, byte scritti)
+def _read_progress(progress_path):
 
-    # Applica text normalization alle phrases in table
-    norm_corpus = spacy_text_norm(corpus) 
+    try:
+        with open(progress_path, 'r', encoding='utf8') as progress_file:
+            return json.load(progress_file)
+    except (OSError, ValueError):
+        return None
 
-    # Ricostruisce la tabella in output
-    return [(record[0], *record[1]) for record in norm_corpus]
+
+def _write_progress(progress_path, progress):
+
+    tmp_path = progress_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf8') as progress_file:
+        json.dump(progress, progress_file)
+    os.replace(tmp_path, progress_path)
 
 
 # Utility per preprocessare un dataframe e salvarlo su disco
 # Se nel file tsv la prima riga non contiene i nomi delle colonne
 # è possibile specificarli con field_names
-def preprocess_tsv(file_path, field_names=None):
-
-    df = pd.read_csv(file_path, sep='\t', names=field_names)
-    tup_list = [tuple(r) for r in df.to_records(index=False)]
-    norm_tup_list = text_triples_norm(tup_list)
-    n_df = pd.DataFrame(norm_tup_list, columns=field_names)
-    n_df.to_csv(file_path + '_text_preprocessed.tsv', sep='\t', index=False, header=False)
-    assert df.shape[0] == n_df.shape[0], 'Row count mismatch!'
+# Il tsv viene letto a blocchi di chunk_size righe, ogni blocco viene normalizzato e aggiunto
+# in coda al file di output (in memoria un blocco alla volta). Dopo ogni blocco lo stato viene
+# salvato in <output>.progress: con resume=True un'esecuzione interrotta riprende dall'ultimo
+# blocco completato (stesso chunk_size), il file di avanzamento viene rimosso alla fine
+# Restituisce il numero di righe preprocessate
+def preprocess_tsv(file_path, field_names=None, chunk_size=DEFAULT_CHUNK_SIZE, resume=True, backend=None,
+                   batch_size=DEFAULT_BATCH_SIZE, service=None):
+
+    import pandas as pd
+    out_path = file_path + '_text_preprocessed.tsv'
+    progress_path = out_path + '.progress'
+
+    # Ripresa: l'output viene riportato alla fine dell'ultimo blocco completato
+    progress = _read_progress(progress_path) if resume else None
+    if progress is None or progress['chunk_size'] != chunk_size or not os.path.exists(out_path):
+        progress = {'chunk_size': chunk_size, 'chunks': 0, 'rows': 0, 'bytes': 0}
+    with open(out_path, 'a', encoding='utf8'):
+        pass
+    os.truncate(out_path, progress['bytes'])
+
+    reader = pd.read_csv(file_path, sep='\t', names=field_names, chunksize=chunk_size)
+    with open(out_path, 'a', encoding='utf8', newline='') as out_file:
+        for i, df in enumerate(reader):
+            # I blocchi già completati vengono solo letti (stessa suddivisione del tsv)
+            if i < progress['chunks']:
+                continue
+            tup_list = list(df.itertuples(index=False, name=None))
+            norm_tup_list = text_triples_norm(tup_list, backend=backend, batch_size=batch_size, service=service)
+            n_df = pd.DataFrame(norm_tup_list, columns=field_names)
+            assert df.shape[0] == n_df.shape[0], 'Row count mismatch!'
+            n_df.to_csv(out_file, sep='\t', index=False, header=False)
+            out_file.flush()
+            os.fsync(out_file.fileno())
+            progress.update(chunks=i + 1, rows=progress['rows'] + n_df.shape[0], bytes=os.path.getsize(out_path))
+            _write_progress(progress_path, progress)
+
+    if os.path.exists(progress_path):
+        os.remove(progress_path)
+
+    return progress['rows']
 
 
 
 ## TEST AREA ##
 if __name__ == '__main__':
 
-    print('Spacy pipeline:', nlp.pipe_names)
+    import pandas as pd
+    print('Spacy pipeline:', get_nlp().pipe_names)
 
     # Reading data for test
     print('Lettura da disco...')
@@ -78,6 +337,7 @@ if __name__ == '__main__':
     tic = time.perf_counter()
     tlist = text_triples_norm(tlist)
     toc = time.perf_counter()
+    print('Cache phrases:', get_cache().stats())
 
     # Print after
     print('\nDopo conversione')
@@ -1,4 +1,6 @@
 # Modulo per la gestione dei tipi
+import os
+import pickle
 import csv
 
 
@@ -14,29 +16,150 @@ def load_tsv(file_path):
     return output
 
 
+# Reticolo dei tipi compilato: la gerarchia [(tipo child, tipo parent)] viene indicizzata
+# una sola volta (id interi, parent per id, ordine topologico dalle radici) in O(V+E).
+# Un tipo con più archi verso parent diversi mantiene l'ultimo, come nella mappa originale
+# Le tabelle di riassegnazione per ogni combinazione (h_level, starred) vengono calcolate
+# con lookup sugli array in ordine topologico e memorizzate, il reticolo (con le tabelle
+# già calcolate) si salva e si ricarica con save / load
+class TypeLattice:
+
+    def __init__(self, hierarchy):
+
+        # Tipi nell'ordine di prima comparsa (child prima del parent)
+        self.index = dict()
+        self.types = list()
+        parent_of = dict()
+        for child, parent in hierarchy:
+            for typ in (child, parent):
+                if typ not in self.index:
+                    self.index[typ] = len(self.types)
+                    self.types.append(typ)
+            parent_of[self.index[child]] = self.index[parent]
+
+        n = len(self.types)
+        self.parent = [parent_of.get(i, -1) for i in range(n)]  # -1 per le radici
+
+        # Ordine topologico (Kahn) dalle radici verso le foglie e profondità di ogni tipo
+        children = [list() for _ in range(n)]
+        for i, p in enumerate(self.parent):
+            if p >= 0:
+                children[p].append(i)
+        self.order = [i for i in range(n) if self.parent[i] < 0]
+        self.depth = [0] * n
+        for i in self.order:  # la lista cresce durante la visita
+            for c in children[i]:
+                self.depth[c] = self.depth[i] + 1
+                self.order.append(c)
+        if len(self.order) != n:
+            raise ValueError('Type hierarchy contains a cycle.')
+
+        self.hmap = None
+        self.remaps = dict()
+
+    def __len__(self):
+        return len(self.types)
+
+    # Dizionario {tipo: [path fino al tipo più generico]} come build_hierarchy_map,
+    # ogni path riusa quello del parent (già calcolato in ordine topologico)
+    def hierarchy_map(self):
+        if self.hmap is None:
+            paths = [None] * len(self.types)
+            for i in self.order:
+                p = self.parent[i]
+                paths[i] = [self.types[i]] + (paths[p] if p >= 0 else [])
+            self.hmap = {typ: paths[i] for i, typ in enumerate(self.types)}
+        return self.hmap
+
+    # Id del tipo che sostituisce ogni tipo per h_level (branch[h_level] del path del tipo,
+    # il tipo stesso se il path è troppo corto), -1 se resta invariato
+    def level_ids(self, h_level):
+        n = len(self.types)
+        if h_level < 0:
+            # branch[h_level] è l'antenato a profondità -h_level - 1 dalla radice
+            level = -h_level - 1
+            target = [-1] * n
+            for i in self.order:
+                if self.depth[i] == level:
+                    target[i] = i
+                elif self.depth[i] > level:
+                    target[i] = target[self.parent[i]]
+            return target
+        # branch[h_level] è l'antenato h_level passi sopra il tipo
+        target = list(range(n))
+        for _ in range(h_level):
+            target = [self.parent[t] if t >= 0 else -1 for t in target]
+        return target
+
+    # Id del tipo preferito più generico (il tipo stesso o un suo antenato) per ogni tipo, -1 se assente
+    def starred_ids(self, starred_types):
+        target = [-1] * len(self.types)
+        for i in self.order:
+            p = self.parent[i]
+            if p >= 0 and target[p] >= 0:
+                target[i] = target[p]
+            elif self.types[i] in starred_types:
+                target[i] = i
+        return target
+
+    # Riassegnazione {tipo: tipo} come types_remap, calcolata una volta per combinazione
+    # (la tabella restituita è condivisa tra le chiamate, non va modificata)
+    def remap(self, h_level=-1, starred_types=None):
+        key = (h_level, frozenset(starred_types) if starred_types else None)
+        try:
+            return self.remaps[key]
+        except KeyError:
+            pass
+
+        target = self.level_ids(h_level)
+        if starred_types:
+            starred = self.starred_ids(set(starred_types))
+            target = [s if s >= 0 else t for s, t in zip(starred, target)]
+        types = self.types
+        remap = {typ: types[t] if t >= 0 else typ for typ, t in zip(types, target)}
+        self.remaps[key] = remap
+
+        return remap
+
+    def save(self, file_path):
+        with open(file_path, 'wb') as pkl_file:
+            pickle.dump(self, pkl_file, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def load(file_path):
+        with open(file_path, 'rb') as pkl_file:
+            lattice = pickle.load(pkl_file)
+        assert isinstance(lattice, TypeLattice), f'{file_path} is not a type lattice.'
+        return lattice
+
+
+# Reticoli già compilati nel processo {(path, mtime): TypeLattice}
+_lattices = dict()
+
+
+# Reticolo della gerarchia in un tsv, compilato una sola volta per processo
+# cache_path: file del reticolo salvato, riusato se più recente del tsv, altrimenti ricreato
+def get_lattice(hierarchy_filepath, cache_path=None):
+
+    key = (os.path.abspath(hierarchy_filepath), os.path.getmtime(hierarchy_filepath))
+    fresh = cache_path and os.path.exists(cache_path) and os.path.getmtime(cache_path) >= key[1]
+    lattice = _lattices.get(key)
+    if lattice is None:
+        lattice = TypeLattice.load(cache_path) if fresh else TypeLattice(load_tsv(hierarchy_filepath))
+        _lattices[key] = lattice
+    if cache_path and not fresh:
+        lattice.save(cache_path)
+
+    return lattice
+
+
 # A partire da una gerarchia di tipi [(tipo child, tipo parent)]
 # e.g. una lista di coppie [(SportAthlete, Person), ...]
 # Costruisce un dizionario: {tipo: [path fino al tipo più generico]}
 # e.g. {Poet: ['Poet', 'Writer', 'Person', 'Agent']}
 def build_hierarchy_map(hierarchy):
 
-    hmap = dict()
-    for child, parent in hierarchy:
-        # aggiungi arco
-        try:
-            hmap[child] = [child] + hmap[parent]
-        except:
-            hmap[child] = [child, parent]
-            hmap[parent] = [parent]
-
-        for path in hmap.values():
-            last = path[-1]
-            try:
-                path += hmap[last][1:]
-            except:
-                pass
-
-    return hmap
+    return TypeLattice(hierarchy).hierarchy_map()
 
 
 # Restituisce una riassegnazione dei tipi in base a certi parametri
@@ -44,32 +167,15 @@ def build_hierarchy_map(hierarchy):
 # e.g. Poet: ['Poet', 'Writer', 'Person', 'Agent'] se h_level=-1, Poet diventa Agent
 # starred permette di indicare dei tipi preferiti, se il tipo corrente ne è un sottotipo
 # e.g. Poet: ['Poet', 'Writer', 'Person', 'Agent'] se starred=['Person'] Poet diventa Person a prescindere
+# hierarchy_filepath può essere il path del tsv della gerarchia o un TypeLattice già compilato
 def types_remap(hierarchy_filepath, h_level=-1, starred_types=None):
 
-    hierarchy = load_tsv(hierarchy_filepath)
-    hmap = build_hierarchy_map(hierarchy)
+    if isinstance(hierarchy_filepath, TypeLattice):
+        lattice = hierarchy_filepath
+    else:
+        lattice = get_lattice(hierarchy_filepath)
 
-    remap = dict()
-    for typ, branch in hmap.items():
-        if not starred_types:
-            try:
-                remap[typ] = branch[h_level]
-            except:
-                remap[typ] = typ
-        else:
-            starred = False            
-            for desc in reversed(branch):
-                if desc in starred_types:
-                    remap[typ] = desc
-                    starred = True
-                    break
-            if not starred:
-                try:
-                    remap[typ] = branch[h_level]
-                except:
-                    remap[typ] = typ
-
-    return remap
+    return lattice.remap(h_level, starred_types)
 
 
 
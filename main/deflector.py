@@ -1,5 +1,46 @@
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from tqdm import tqdm
 import numpy as np
+import time
+import os
+
+
+# RSS corrente del processo (byte), None se non disponibile
+def current_rss():
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+# Dimensione adattiva dei batch di link prediction: ogni batch osservato aggiorna il
+# throughput (coppie al secondo) e la dimensione tende a quella che richiede target_latency
+# secondi (al più raddoppia o dimezza ad ogni passo). Con memory_budget (byte) la memoria per
+# coppia osservata (crescita dell'RSS durante la predizione) limita i batch in volo al budget
+# La memoria misurata è solo l'RSS del processo: il limite vale per link predictor residenti
+# in CPU, la memoria della GPU (e.g. ComplEx su CUDA) non viene contata
+class AdaptiveBatchSize:
+
+    def __init__(self, size, min_size=500, max_size=100000, target_latency=2.0, memory_budget=None, in_flight=1):
+        self.min_size = min_size
+        self.max_size = max_size
+        self.size = min(max(size, min_size), max_size)
+        self.target_latency = target_latency
+        self.memory_budget = memory_budget
+        self.in_flight = in_flight
+        self.pair_bytes = 0
+
+    def observe(self, n, latency, memory_delta=None):
+        if memory_delta and memory_delta > 0:
+            self.pair_bytes = max(self.pair_bytes, memory_delta / n)
+        size = self.size
+        if latency > 0:
+            ideal = n / latency * self.target_latency
+            size = int(min(max(ideal, size / 2), size * 2))
+        if self.memory_budget and self.pair_bytes:
+            size = min(size, int(self.memory_budget / (self.pair_bytes * self.in_flight)))
+        self.size = min(max(size, self.min_size), self.max_size)
 
 # Deflector è un meta-sistema per la relation extraction
 # che può sfruttare un qualsiasi sistema di link prediction
@@ -16,80 +57,161 @@ class Deflector:
     # e deve restituire [{top relations for e1 e2}]
     # PRE: le dimensioni di input ed output devono essere identiche ed associare alle
     # le relazioni che non possono essere estratte o predette la stringa 'unknown'  
-    def __init__(self, re_wrapper_fun, lp_wrapper_fun):
+    def __init__(self, re_wrapper_fun, lp_wrapper_fun, lp_cache=None):
         self.relation_extraction_model = re_wrapper_fun
         self.link_prediction_model = lp_wrapper_fun
+        self.lp_cache = lp_cache  # cache persistente delle predizioni (prediction_cache.PredictionCache)
         self.pattern_black_list = dict() # {pattern: (old_relation, score)}
         self.pattern_discovery = dict()  # {pattern: (new_relation, score)} # solo per ex relation unknown
 
 
     # Applica i filtri sull'output invece che sull'input
-    def extract_relations(self, raw_re_input, keep_unknown=False, keep_patterns=False, keep_pairs=False):
-        
+    # lazy=True restituisce un generatore (iter_relations) invece della lista
+    def extract_relations(self, raw_re_input, keep_unknown=False, keep_patterns=False, keep_pairs=False, lazy=False):
+
+        output = self.iter_relations(raw_re_input, keep_unknown, keep_patterns, keep_pairs)
+        if lazy:
+            return output
+
+        return list(output)
+
+
+    # Generatore dell'output filtrato: black list, discovery e filtri (keep_unknown,
+    # keep_pairs, keep_patterns) applicati in un'unica passata sull'output del modello di
+    # relation extraction, nessuna lista intermedia
+    def iter_relations(self, raw_re_input, keep_unknown=False, keep_patterns=False, keep_pairs=False):
+
         # Input ed Output formattati del modello relation extraction
         re_output = self.relation_extraction_model(raw_re_input)
+        black_list = self.pattern_black_list
+        discovery = self.pattern_discovery
 
         # Filtra l'output di relation extraction 
-        output = list()
         for pattern, p_relation, pair in re_output:
-            sbj, obj = pair
             if p_relation != 'unknown':
-                try:
-                    self.pattern_black_list[pattern]
-                    output.append((pattern, (sbj, 'unknown', obj)))
-                except:
-                    output.append((pattern, (sbj, p_relation, obj)))
+                if pattern in black_list:
+                    p_relation = 'unknown'
             else:
                 try:
-                    new_rel = self.pattern_discovery[pattern][0]
-                    output.append((pattern, (sbj, new_rel, obj)))
+                    p_relation = discovery[pattern][0]
                 except:
-                    output.append((pattern, (sbj, p_relation, obj)))
-
-        # Se si vogliono escludere fatti con relazione 'unknown'
-        if not keep_unknown:
-            output = [x for x in output if x[1][1] != 'unknown']
+                    pass
 
-        # Se non si vogliono tenere le coppie anche nell'output
-        if not keep_pairs:
-            output = [(x[0], x[1][1]) for x in output]
+            # Se si vogliono escludere fatti con relazione 'unknown'
+            if not keep_unknown and p_relation == 'unknown':
+                continue
 
-        # Non tiene traccia del pattern che ha predetto il fatto
-        if not keep_patterns:
-            output = [x[1] for x in output]            
+            # Se non si vogliono tenere le coppie anche nell'output
+            if keep_pairs:
+                fact = (pair[0], p_relation, pair[1])
+            else:
+                fact = p_relation
 
-        return output
+            # Non tiene traccia del pattern che ha predetto il fatto
+            if keep_patterns:
+                yield (pattern, fact)
+            else:
+                yield fact
 
 
     # Da dizionario: {pattern: (relation, [(subject, object), ...]), ...}
     # A dizionario: {(pair): {set predizioni}}
-    def batch_predict(self, pattern2relpairs, link_predictor, batch_size):
+    # I batch di coppie distinte vengono predetti da un pool di thread (workers, al più
+    # workers + 1 batch in volo): preparazione dei batch, link prediction e scrittura dei
+    # risultati nella tabella preallocata si sovrappongono. La dimensione dei batch parte da
+    # batch_size e si adatta alla latenza e alla memoria osservate (AdaptiveBatchSize)
+    # Di default (workers=1) predice in serie nel thread corrente (link predictor non thread-safe,
+    # e.g. un unico modello su GPU) con batch fissi di batch_size coppie: concorrenza e
+    # adattamento dei batch vanno abilitati esplicitamente. I batch si riducono (fino a
+    # min_batch_size, default 500) solo se viene indicato min_batch_size, target_latency
+    # (default 2 secondi) o memory_budget e crescono solo fino a max_batch_size (default batch_size)
+    # memory_budget si applica solo con workers=1: con più batch in volo la crescita dell'RSS
+    # misurata attorno ad una predizione include quella degli altri batch
+    # Con cache (PredictionCache) solo le coppie mai predette con lo stesso modello arrivano
+    # al link predictor, le nuove predizioni vengono aggiunte alla cache
+    def batch_predict(self, pattern2relpairs, link_predictor, batch_size, workers=1, target_latency=None,
+                      min_batch_size=None, max_batch_size=None, memory_budget=None, cache=None):
 
-        # Init output structure
-        all_pairs = set()
+        # Tabella preallocata {coppia: predizione} con le coppie distinte
+        table = dict()
         print('\nFinding all unique pairs to be predicted...')
         for _, pairs in tqdm(pattern2relpairs.values()):
-            for pair in pairs:
-                all_pairs.add(pair)
+            table.update(dict.fromkeys(pairs))
+        all_pairs = list(table)
+
+        # Coppie già predette dallo stesso modello
+        if cache is not None:
+            table.update(cache.get_many(all_pairs))
+            all_pairs = [pair for pair in all_pairs if table[pair] is None]
+            print(f'Prediction cache: {cache.hits} hits, {cache.misses} misses (hit rate {cache.hit_rate():.1%})')
+
+        if workers is None:
+            workers = min(4, os.cpu_count() or 1)
+        if workers > 1:
+            memory_budget = None
+        shrink = min_batch_size is not None or target_latency is not None or memory_budget is not None
+        if target_latency is None:
+            target_latency = 2.0
+        if min_batch_size is None:
+            min_batch_size = 500 if shrink else batch_size
+        if max_batch_size is None:
+            max_batch_size = batch_size
+        sizer = AdaptiveBatchSize(batch_size, min(min_batch_size, batch_size), max(max_batch_size, batch_size),
+                                  target_latency, memory_budget, in_flight=1 if workers <= 1 else workers + 1)
+
+        # Link prediction di un batch (nei thread del pool), con latenza e crescita dell'RSS
+        def predict(batch):
+            rss = current_rss()
+            tic = time.perf_counter()
+            predictions = link_predictor(batch)
+            latency = time.perf_counter() - tic
+            memory_delta = current_rss() - rss if rss is not None else None
+            return batch, predictions, latency, memory_delta
+
+        # Scrittura dei risultati nella tabella (nel thread principale)
+        def merge(batch, predictions, latency, memory_delta):
+            for pair, prediction in zip(batch, predictions):
+                table[pair] = prediction
+            if cache is not None:
+                cache.put_many(zip(batch, predictions))
+            sizer.observe(len(batch), latency, memory_delta)
+            progress.update(len(batch))
 
-        # Batch predict
-        all_pairs = list(all_pairs)
-        result = list()
         print('\nBatch predicting relations...')
-        for i in tqdm(range(0, len(all_pairs), batch_size)):
-            result += zip(all_pairs[i:i+batch_size], link_predictor(all_pairs[i:i+batch_size]))
+        progress = tqdm(total=len(all_pairs))
+        start = 0
+        if workers <= 1:
+            while start < len(all_pairs):
+                batch = all_pairs[start:start + sizer.size]
+                start += len(batch)
+                merge(*predict(batch))
+        else:
+            with ThreadPoolExecutor(workers) as pool:
+                pending = set()
+                while start < len(all_pairs) or pending:
+                    # Prefetch: nuovi batch finché ci sono al più workers + 1 batch in volo
+                    while start < len(all_pairs) and len(pending) <= workers:
+                        batch = all_pairs[start:start + sizer.size]
+                        start += len(batch)
+                        pending.add(pool.submit(predict, batch))
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        merge(*future.result())
+        progress.close()
 
-        return dict(result)
+        return table
 
 
     # Identifica pattern deboli e li aggiunge alla black list
-    def deflect_patterns(self, raw_re_input, bs=5000, bl_min_len=5, bl_thresh=0.7, pd_min_len=10, pd_thresh=0.7, pd_enabled=False):
-
-        ex_trace = self.extract_relations(raw_re_input, keep_unknown=True, keep_patterns=True, keep_pairs=True)
+    # lp_workers: thread della link prediction (batch_predict), default 1 (link predictor non
+    # thread-safe o su GPU), None usa min(4, CPU)
+    def deflect_patterns(self, raw_re_input, bs=5000, bl_min_len=5, bl_thresh=0.7, pd_min_len=10, pd_thresh=0.7, pd_enabled=False,
+                         lp_workers=1):
 
         # Costruisce un dizionario {pattern: (relation, [(subject, object), ...]), ...}
+        # direttamente dal generatore dell'output filtrato (nessuna lista dell'intero output)
         pattern2instances = dict()
-        for pattern, opinion in ex_trace:
+        for pattern, opinion in self.iter_relations(raw_re_input, keep_unknown=True, keep_patterns=True, keep_pairs=True):
             try:
                 sbj, _, obj = opinion
                 pattern2instances[pattern][1].append((sbj, obj))
@@ -98,39 +220,110 @@ class Deflector:
                 pattern2instances[pattern] = (relation, [(sbj, obj)])
 
         # Build dictionary {pair: predicted relations as a set}
-        pair2pred = self.batch_predict(pattern2instances, self.link_prediction_model, batch_size=bs)
+        pair2pred = self.batch_predict(pattern2instances, self.link_prediction_model, batch_size=bs, workers=lp_workers,
+                                       cache=self.lp_cache)
 
         print('\nDeflecting patterns...')
-        for pattern, track in tqdm(pattern2instances.items()):
-            relation, pairs = track            
-            predictions = [pair2pred[pair] for pair in pairs if 'unknown' not in pair2pred[pair]]
-            preds_len = len(predictions)
-            if relation != 'unknown' and preds_len >= bl_min_len:
-                matches = [relation in pred for pred in predictions]                
-                pattern_score = sum(matches)/len(matches)
-                # Pattern blacklist
-                if pattern_score < bl_thresh:                    
-                    self.pattern_black_list[pattern] = (relation, pattern_score)            
-            elif pd_enabled and preds_len >= pd_min_len:
-                all_pred_size = [len(pred) for pred in predictions]
-                rel2weight = dict()
-                for n, preds in enumerate(predictions):
-                    for rel in preds:
-                        try:
-                            rel2weight[rel] += 1/all_pred_size[n]
-                        except:
-                            rel2weight[rel] = 1/all_pred_size[n]
-                
-                max_rel1 = max(rel2weight, key=rel2weight.get)
-                max_wgh1 = rel2weight[max_rel1]
-                del(rel2weight[max_rel1])
-                try:                        
-                    max_rel2 = max(rel2weight, key=rel2weight.get)
-                    max_wgh2 = rel2weight[max_rel2]
-                except:
-                    max_wgh2 = 0
+        black_list, discovery = self.score_patterns(pattern2instances, pair2pred, bl_min_len, bl_thresh,
+                                                    pd_min_len, pd_thresh, pd_enabled)
+        self.pattern_black_list.update(black_list)
+        self.pattern_discovery.update(discovery)
+
+
+    # Punteggi di black list e discovery di tutti i pattern in forma colonnare
+    # Pattern e coppie diventano id, le predizioni una matrice indicatrice CSR coppie x
+    # relazioni (indptr, indices, colonne di ogni riga nell'ordine di iterazione del set
+    # predetto); ogni istanza (pattern, coppia) con predizione nota si espande nelle sue
+    # relazioni e conteggi delle corrispondenze e voti pesati (1/numero di relazioni
+    # predette) sono riduzioni per segmento con np.bincount, che somma nell'ordine delle
+    # istanze come il ciclo per pattern (stessi float). A parità di voto vince la relazione
+    # apparsa per prima nel pattern, come max(...) sul dizionario {rel: peso}
+    # Restituisce ({pattern: (relation, score)}, {pattern: (new_relation, score)})
+    # con i pattern nell'ordine di pattern2instances
+    def score_patterns(self, pattern2instances, pair2pred, bl_min_len=5, bl_thresh=0.7, pd_min_len=10, pd_thresh=0.7,
+                       pd_enabled=False):
+
+        # Coppie e relazioni predette come id, predizioni 'unknown' escluse (righe vuote)
+        pair_index = dict()
+        rel_index = dict()
+        indptr, indices, known = [0], list(), list()
+        for pair, pred in pair2pred.items():
+            pair_index[pair] = len(pair_index)
+            is_known = 'unknown' not in pred
+            known.append(is_known)
+            if is_known:
+                for rel in pred:
+                    try:
+                        indices.append(rel_index[rel])
+                    except KeyError:
+                        rel_index[rel] = len(rel_index)
+                        indices.append(rel_index[rel])
+            indptr.append(len(indices))
+        indptr = np.array(indptr, dtype=np.int64)
+        indices = np.array(indices, dtype=np.int64)
+        known = np.array(known, dtype=bool)
+
+        # Pattern come id: relazione estratta (-1 se non predicibile), numero di coppie
+        # e coppie di tutte le istanze concatenate nell'ordine dei pattern
+        patterns = list(pattern2instances)
+        relations = list()
+        pattern_rel, labeled, n_pairs, inst_pair = list(), list(), list(), list()
+        for relation, pairs in pattern2instances.values():
+            relations.append(relation)
+            pattern_rel.append(rel_index.get(relation, -1))
+            labeled.append(relation != 'unknown')
+            n_pairs.append(len(pairs))
+            inst_pair.extend([pair_index[pair] for pair in pairs])
+        n_patterns = len(patterns)
+        pattern_rel = np.array(pattern_rel, dtype=np.int64)
+        labeled = np.array(labeled, dtype=bool)
+        n_pairs = np.array(n_pairs, dtype=np.int64)
+        inst_pair = np.array(inst_pair, dtype=np.int64)
+        inst_pattern = np.repeat(np.arange(n_patterns), n_pairs)
+
+        # Solo le istanze con predizione nota
+        keep = known[inst_pair]
+        inst_pair, inst_pattern = inst_pair[keep], inst_pattern[keep]
+        preds_len = np.bincount(inst_pattern, minlength=n_patterns)
+
+        # Espansione istanze -> (istanza, relazione predetta) nell'ordine delle istanze
+        lengths = np.diff(indptr)[inst_pair]
+        entry_inst = np.repeat(np.arange(len(inst_pair)), lengths)
+        offset = np.arange(len(entry_inst)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        entry_rel = indices[indptr[inst_pair][entry_inst] + offset]
+        entry_pattern = inst_pattern[entry_inst]
+
+        # Pattern blacklist: frazione delle predizioni che contengono la relazione estratta
+        bl_candidate = labeled & (preds_len >= bl_min_len)
+        matches = np.bincount(entry_pattern[entry_rel == pattern_rel[entry_pattern]], minlength=n_patterns)
+        bl_rows = np.flatnonzero(bl_candidate)
+        bl_scores = matches[bl_rows] / preds_len[bl_rows]
+        weak = bl_scores < bl_thresh
+        black_list = {patterns[r]: (relations[r], score) for r, score in zip(bl_rows[weak].tolist(), bl_scores[weak].tolist())}
+
+        # Pattern discovery: scarto tra le due relazioni più votate sul numero di coppie
+        discovery = dict()
+        pd_candidate = ~bl_candidate & (preds_len >= pd_min_len)
+        if not pd_enabled or not pd_candidate.any():
+            return black_list, discovery
+        sel = pd_candidate[entry_pattern]
+        n_rels = max(len(rel_index), 1)
+        keys, first, inverse = np.unique(entry_pattern[sel] * n_rels + entry_rel[sel], return_index=True, return_inverse=True)
+        weights = np.bincount(inverse.ravel(), weights=1 / lengths[entry_inst[sel]])
+        key_pattern, key_rel = keys // n_rels, keys % n_rels
+
+        # Segmenti per pattern: prima la relazione con voto massimo apparsa per prima
+        starts = np.flatnonzero(np.r_[True, key_pattern[1:] != key_pattern[:-1]])
+        best = np.lexsort((first, -weights, key_pattern))[starts]
+        others = weights.copy()
+        others[best] = -np.inf
+        second = np.maximum.reduceat(others, starts)
+        second[second == -np.inf] = 0
+        pd_rows = key_pattern[starts]
+        pd_scores = (weights[best] - second) / n_pairs[pd_rows]
+        strong = pd_scores >= pd_thresh
+        rel_names = list(rel_index)
+        for r, rel, score in zip(pd_rows[strong].tolist(), key_rel[best][strong].tolist(), pd_scores[strong].tolist()):
+            discovery[patterns[r]] = (rel_names[rel], score)
 
-                max_rel_score = (max_wgh1 - max_wgh2)/len(pairs)
-                # Pattern discovery
-                if max_rel_score >= pd_thresh:
-                    self.pattern_discovery[pattern] = (max_rel1, max_rel_score)
+        return black_list, discovery
@@ -5,6 +5,10 @@ from sklearn.preprocessing import minmax_scale
 
 import torch
 
+# File del modello e soglia sugli score normalizzati (identificano le predizioni, vedi prediction_cache)
+MODEL_FILE = 'ComplEx/stored_models/ComplEx_split_degree_build_v2_d500_bs1000.pt'
+SCORE_THRESHOLD = 0.9
+
 # Init dataset
 print('Loading ComplEx dataset...', end='', flush=True)
 #DATASET = Dataset(name='FB15k-237') # Imposta nome dataset
@@ -18,7 +22,7 @@ print("Initializing ComplEx model...", end='', flush=True)
 COMPLEX = ComplEx(dataset=DATASET, hyperparameters=hyperparameters, init_random=True)   # type: ComplEx
 COMPLEX.to('cuda')
 #COMPLEX.load_state_dict(torch.load('complexPackage/stored_models/ComplEx_FB15k-237.pt')) # Imposta file di modello da caricare
-COMPLEX.load_state_dict(torch.load('ComplEx/stored_models/ComplEx_split_degree_build_v2_d500_bs1000.pt')) # Imposta file di modello da caricare
+COMPLEX.load_state_dict(torch.load(MODEL_FILE)) # Imposta file di modello da caricare
 COMPLEX.eval()
 print('Done.')
 
@@ -47,7 +51,7 @@ def complex_wrapper(list_of_pairs):
     minmax_scale(all_scores, axis=1, copy=False)
 
     # Array 2d con le posizioni [[riga, colonna]] dei valori che superano la soglia
-    best_rels = np.argwhere(all_scores > 0.9) 
+    best_rels = np.argwhere(all_scores > SCORE_THRESHOLD) 
         
     # Build wrapper output
     complex_output = [set() for _ in complex_input]
@@ -0,0 +1,74 @@
+# Cache persistente (SQLite) delle predizioni di link prediction: {(e1, e2): {relazioni}}
+# Le predizioni dipendono solo dal modello di LP e dalla coppia di entità: la chiave del
+# modello (model_key, e.g. hash del file .pt e soglia) separa modelli diversi nello stesso
+# database, rieseguire un esperimento con lo stesso modello non ripete la link prediction
+import hashlib
+import sqlite3
+import os
+
+
+# Separatore delle relazioni di una predizione nel database
+REL_SEP = '\t'
+
+
+# Identità di un modello di LP: hash del contenuto dei file e dei valori indicati
+# e.g. model_key('ComplEx/stored_models/model.pt', 0.9)
+def model_key(*parts):
+
+    digest = hashlib.sha1()
+    for part in parts:
+        if isinstance(part, str) and os.path.isfile(part):
+            with open(part, 'rb') as model_file:
+                for block in iter(lambda: model_file.read(1 << 20), b''):
+                    digest.update(block)
+        else:
+            digest.update(repr(part).encode('utf8'))
+        digest.update(b'\0')
+
+    return digest.hexdigest()
+
+
+class PredictionCache:
+
+    def __init__(self, path, model_key):
+        self.path = path
+        self.model_key = model_key
+        self.hits = 0
+        self.misses = 0
+        self.conn = sqlite3.connect(path)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS predictions (model TEXT, e1 TEXT, e2 TEXT, rels TEXT, '
+                          'PRIMARY KEY (model, e1, e2)) WITHOUT ROWID')
+
+    # Predizioni già note {(e1, e2): {relazioni}} tra le coppie richieste (distinte)
+    # Le coppie vengono caricate in una tabella temporanea e unite alla cache con un join
+    def get_many(self, pairs):
+        conn = self.conn
+        conn.execute('CREATE TEMP TABLE IF NOT EXISTS lookup (e1 TEXT, e2 TEXT)')
+        conn.execute('DELETE FROM lookup')
+        conn.executemany('INSERT INTO lookup VALUES (?, ?)', pairs)
+        rows = conn.execute('SELECT l.e1, l.e2, p.rels FROM lookup l JOIN predictions p '
+                            'ON p.model = ? AND p.e1 = l.e1 AND p.e2 = l.e2', (self.model_key,))
+        found = {(e1, e2): set(rels.split(REL_SEP)) if rels else set() for e1, e2, rels in rows}
+        conn.execute('DELETE FROM lookup')
+
+        self.hits += len(found)
+        self.misses += len(pairs) - len(found)
+        return found
+
+    # Salva le predizioni [((e1, e2), {relazioni}), ...]
+    def put_many(self, items):
+        with self.conn:
+            self.conn.executemany('INSERT OR REPLACE INTO predictions VALUES (?, ?, ?, ?)',
+                                  [(self.model_key, e1, e2, REL_SEP.join(sorted(rels))) for (e1, e2), rels in items])
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hit_rate()}
+
+    def close(self):
+        self.conn.close()
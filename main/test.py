@@ -1,5 +1,6 @@
 from SELector.selector import SELector
 from deflector import Deflector
+from prediction_cache import PredictionCache, model_key
 import random
 import csv
 
@@ -13,12 +14,13 @@ def read_tsv(file_path):
     return out
 
 
-def deflector_test(patterns, knowledge_graph, link_predictor='base', perfect_lp_knowledge=None):
+# lp_cache_path: database delle predizioni di link prediction condiviso tra le esecuzioni (None per disattivarlo)
+def deflector_test(patterns, knowledge_graph, link_predictor='base', perfect_lp_knowledge=None, lp_cache_path='lp_cache.sqlite'):
 
     # Relation extraction model (Lector)
     print('Training relation extraction model...', flush=True)
     slc = SELector(rseed=42, unlabeled_sub=0.5)
-    slc.train(patterns, knowledge_graph)
+    slc.train(patterns, knowledge_graph, keep_tables=True)
 
     print(f'\nTotal labeled: {len(slc.labeled_triples)}, examples:')
     [print(x) for x in slc.labeled_triples[:10]]
@@ -54,17 +56,25 @@ def deflector_test(patterns, knowledge_graph, link_predictor='base', perfect_lp_
         # Define wrapper
         def lp_wrapper(pairList):            
             return lp_model.predict(pairList)
+        lp_key = model_key('base', perfect_lp_knowledge)
     elif link_predictor == 'complex':
         print('\nLoading ComplEx as link predicion model...', flush=True)
-        from link_prediction_complex import complex_wrapper
+        from link_prediction_complex import complex_wrapper, MODEL_FILE, SCORE_THRESHOLD
         lp_wrapper = complex_wrapper
+        lp_key = model_key('complex', MODEL_FILE, SCORE_THRESHOLD)
+
+    # Cache persistente delle predizioni (chiave: identità del modello di link prediction)
+    lp_cache = PredictionCache(lp_cache_path, lp_key) if lp_cache_path else None
 
     # Relation extraction meta-model (Deflector)
-    dfl = Deflector(selector_re_wrapper, lp_wrapper)
+    dfl = Deflector(selector_re_wrapper, lp_wrapper, lp_cache=lp_cache)
 
     # Deflect patterns
     print('\nActivating Deflector system...', flush=True)
     dfl.deflect_patterns(patterns, pd_enabled=True)
+    if lp_cache is not None:
+        print('Prediction cache:', lp_cache.stats())
+        lp_cache.close()
 
     # Load and shuffle structures for examples
     discovered = list(dfl.pattern_discovery.items())